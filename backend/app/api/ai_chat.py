@@ -1,18 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import List, Dict
-import json
+from typing import List, Dict, Tuple
 
-from app.core.database import get_db
+from app.core.database import get_async_db
+from app.core.executors import ai_executor
+from app.models.discussion_message import DiscussionMessage
 from app.models.note import Note
 from app.models.audiobook import Audiobook
 from app.services.ai_service import ai_service
 
 router = APIRouter()
 
+# Сколько последних сообщений сохранённого обсуждения отдаётся AI как контекст
+AI_CONTEXT_MESSAGES = 50
+MAX_HISTORY_PAGE = 200
+
 
 class ChatMessage(BaseModel):
+    id: int | None = None
     role: str  # "user" or "assistant"
     content: str
 
@@ -29,19 +36,37 @@ class DiscussQuoteResponse(BaseModel):
     history: List[ChatMessage]
 
 
+class DiscussionHistoryResponse(BaseModel):
+    history: List[ChatMessage]
+    has_more: bool = False
+    before: int | None = None  # курсор предыдущей страницы: ?before=<id>
+
+
+async def latest_messages(
+    db: AsyncSession, note_id: int, limit: int, before: int | None = None
+) -> Tuple[List[DiscussionMessage], bool]:
+    """Последние limit сообщений заметки (до before) в хронологическом порядке и есть ли более ранние"""
+    query = select(DiscussionMessage).where(DiscussionMessage.note_id == note_id)
+    if before is not None:
+        query = query.where(DiscussionMessage.id < before)
+    rows = (await db.scalars(query.order_by(DiscussionMessage.id.desc()).limit(limit + 1))).all()
+    return list(reversed(rows[:limit])), len(rows) > limit
+
+
 @router.post("/discuss", response_model=DiscussQuoteResponse)
 async def discuss_quote(
     request: DiscussQuoteRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Обсуждение цитаты с AI"""
     
     # Получаем информацию об аудиокниге для контекста
+    note = None
     audiobook_context = None
     if request.note_id:
-        note = db.query(Note).filter(Note.id == request.note_id).first()
+        note = await db.get(Note, request.note_id)
         if note:
-            audiobook = db.query(Audiobook).filter(Audiobook.id == note.audiobook_id).first()
+            audiobook = await db.get(Audiobook, note.audiobook_id)
             if audiobook:
                 # Формируем контекст произведения
                 audiobook_context = {
@@ -57,10 +82,18 @@ async def discuss_quote(
             {"role": msg.role, "content": msg.content}
             for msg in request.history
         ]
+    elif note and note.discussion_count:
+        # Клиент не прислал историю - продолжаем сохранённое обсуждение
+        stored, _ = await latest_messages(db, note.id, AI_CONTEXT_MESSAGES)
+        history_messages = [{"role": msg.role, "content": msg.content} for msg in stored]
+    
+    # Ответ AI занимает секунды - соединение с БД на это время возвращаем в пул
+    await db.close()
     
     # Получаем ответ от AI с контекстом произведения
     try:
-        response = ai_service.discuss_quote(
+        response = await ai_executor.run(
+            ai_service.discuss_quote,
             quote=request.quote,
             context=request.context or "",
             history=history_messages if history_messages else None,
@@ -103,12 +136,13 @@ async def discuss_quote(
     # Добавляем ответ ассистента
     new_history.append({"role": "assistant", "content": response})
     
-    # Если указана заметка, сохраняем историю
-    if request.note_id:
-        note = db.query(Note).filter(Note.id == request.note_id).first()
-        if note:
-            note.ai_discussion = json.dumps(new_history, ensure_ascii=False)
-            db.commit()
+    # Если указана заметка, дописываем новый ход (вопрос и ответ) одним INSERT
+    if note:
+        db.add_all([
+            DiscussionMessage(note_id=note.id, role=msg["role"], content=msg["content"])
+            for msg in new_history[-2:]
+        ])
+        await db.commit()
     
     return {
         "response": response,
@@ -119,25 +153,27 @@ async def discuss_quote(
     }
 
 
-@router.get("/discussion/{note_id}")
-async def get_discussion_history(note_id: int, db: Session = Depends(get_db)):
-    """Получение истории обсуждения для заметки"""
-    note = db.query(Note).filter(Note.id == note_id).first()
+@router.get("/discussion/{note_id}", response_model=DiscussionHistoryResponse)
+async def get_discussion_history(
+    note_id: int,
+    limit: int = 100,
+    before: int | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    История обсуждения заметки страницами с конца: последние limit сообщений,
+    более ранние - с before из ответа.
+    """
+    note = await db.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    if not note.ai_discussion:
-        return {"history": []}
-    
-    try:
-        history = json.loads(note.ai_discussion)
-        return {
-            "history": [
-                ChatMessage(role=msg["role"], content=msg["content"])
-                for msg in history
-            ]
-        }
-    except json.JSONDecodeError:
-        return {"history": []}
-
-
+    messages, has_more = await latest_messages(db, note_id, min(max(limit, 1), MAX_HISTORY_PAGE), before)
+    return {
+        "history": [
+            ChatMessage(id=msg.id, role=msg.role, content=msg.content)
+            for msg in messages
+        ],
+        "has_more": has_more,
+        "before": messages[0].id if has_more else None
+    }
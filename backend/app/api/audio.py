@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Optional
+import os
+
+from app.core.audio_response import AudioFileResponse, file_etag
+from app.core.database import get_async_db
+from app.models.audiobook import Audiobook
+from app.services.download_service import from_audio_url
+from app.services.storage_manager import storage_manager
+
+router = APIRouter()
+
+AUDIO_MEDIA_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.aac': 'audio/aac',
+    '.opus': 'audio/ogg',
+    '.ogg': 'audio/ogg',
+    '.webm': 'audio/webm',
+    '.flac': 'audio/flac',
+    '.wav': 'audio/wav',
+}
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+def versioned_audio_url(audiobook_id: int, audio_url: str, rendition: Optional[str] = None) -> Optional[str]:
+    """
+    Content-addressed URL файла: /api/audio/{id}?v=<etag>. При замене файла
+    меняется и URL, поэтому ответ по нему кэшируется как immutable.
+    """
+    try:
+        etag = file_etag(os.stat(from_audio_url(audio_url)))
+    except OSError:
+        return None
+    url = f"/api/audio/{audiobook_id}?v={etag}"
+    if rendition:
+        url += f"&rendition={rendition}"
+    return url
+
+
+@router.api_route("/audio/{audiobook_id}", methods=["GET", "HEAD"])
+async def serve_audio(
+    audiobook_id: int,
+    request: Request,
+    rendition: str | None = None,
+    v: str | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Отдача скачанного аудио (или rendition) с ETag, Range и sendfile.
+    С параметром v, совпадающим с текущим ETag, ответ кэшируется навсегда,
+    без него - с обязательной ревалидацией (304 по If-None-Match).
+    """
+    options = [selectinload(Audiobook.renditions)] if rendition else []
+    audiobook = await db.get(Audiobook, audiobook_id, options=options)
+    if not audiobook:
+        raise HTTPException(status_code=404, detail="Audiobook not found")
+
+    if rendition:
+        match = next((r for r in audiobook.renditions if r.name == rendition), None)
+        if not match:
+            raise HTTPException(status_code=404, detail="Rendition not found")
+        audio_url = match.audio_file_path
+    else:
+        if not audiobook.is_downloaded or not audiobook.audio_file_path:
+            raise HTTPException(status_code=404, detail="Audio file not downloaded")
+        audio_url = audiobook.audio_file_path
+
+    # Соединение возвращается в пул до отдачи файла, а не после неё
+    await db.close()
+
+    file_path = from_audio_url(audio_url)
+    try:
+        stat_result = await run_in_threadpool(os.stat, file_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    response = AudioFileResponse(
+        file_path,
+        stat_result,
+        request.headers,
+        media_type=AUDIO_MEDIA_TYPES.get(os.path.splitext(file_path)[1], 'application/octet-stream'),
+        cache_control=IMMUTABLE_CACHE if v == file_etag(stat_result) else "no-cache",
+        method=request.method,
+    )
+
+    if response.status_code in (200, 206):
+        # Прослушиванием считаем запрос с начала файла, а не каждый Range при перемотке
+        plays = 1 if request.method == "GET" and response.start == 0 else 0
+        await run_in_threadpool(storage_manager.touch, audiobook_id, plays)
+
+    return response
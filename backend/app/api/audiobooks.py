@@ -1,18 +1,120 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List
 from pydantic import BaseModel
+import json
 import os
+import re
 from datetime import datetime
 
-from app.core.database import get_db
+from app.api.audio import versioned_audio_url
+from app.core.database import get_async_db
+from app.core.executors import ai_executor
+from app.core.pagination import (
+    MAX_PAGE_SIZE, InvalidCursor, SortKey, datetime_key, keyset_query, split_page
+)
 from app.models.audiobook import Audiobook
-from app.services.youtube_service import youtube_service
+from app.models.download_job import DownloadJob
 from app.services.ai_service import ai_service
-from app.core.config import settings
+from app.services.download_queue import download_queue, ACTIVE_STATUSES
+from app.services.download_service import parse_renditions, from_audio_url
+from app.services.file_lock import audiobook_lock
+from app.services.media_service import RENDITION_PRESETS
+from app.services.progress_tracker import progress_tracker, TERMINAL_STATUSES
+from app.services.storage_manager import storage_manager
+from app.services.youtube_service import AUDIO_PROFILES
 
 router = APIRouter()
 
+HLS_FILE_RE = re.compile(r'^(index\.m3u8|segment_\d+_\d+\.ts)$')
+
+# sort=<key> или sort=-<key> (по убыванию); при равных значениях порядок по id
+AUDIOBOOK_SORT_KEYS = {
+    "id": SortKey(Audiobook.id, lambda book: book.id),
+    "title": SortKey(Audiobook.title, lambda book: book.title),
+    "duration": SortKey(func.coalesce(Audiobook.duration, 0.0), lambda book: book.duration or 0.0),
+    "created_at": datetime_key(Audiobook.created_at, "created_at"),
+    "updated_at": datetime_key(Audiobook.updated_at, "updated_at"),
+}
+
+
+async def list_audiobooks(
+    db: AsyncSession,
+    response: Response,
+    *,
+    playlist_id: int | None = None,
+    is_downloaded: bool | None = None,
+    min_duration: float | None = None,
+    max_duration: float | None = None,
+    sort: str = "id",
+    cursor: str | None = None,
+    limit: int | None = 100,
+    skip: int = 0,
+) -> List[Audiobook]:
+    """
+    Страница аудиокниг с фильтрами и keyset пагинацией.
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    limit=None - весь список (без пагинации), skip - устаревший OFFSET без курсора.
+    """
+    query = select(Audiobook)
+    if playlist_id is not None:
+        query = query.where(Audiobook.playlist_id == playlist_id)
+    if is_downloaded is not None:
+        query = query.where(Audiobook.is_downloaded == is_downloaded)
+    if min_duration is not None:
+        query = query.where(Audiobook.duration >= min_duration)
+    if max_duration is not None:
+        query = query.where(Audiobook.duration <= max_duration)
+
+    page_size = min(max(limit, 1), MAX_PAGE_SIZE) if limit is not None else None
+    try:
+        query = keyset_query(query, Audiobook.id, sort, AUDIOBOOK_SORT_KEYS, cursor, page_size)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if skip and not cursor:
+        query = query.offset(skip)
+
+    audiobooks = (await db.scalars(query)).all()
+    if page_size is None:
+        return audiobooks
+
+    audiobooks, next_cursor = split_page(audiobooks, sort, AUDIOBOOK_SORT_KEYS, page_size)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return audiobooks
+
+
+class DownloadJobResponse(BaseModel):
+    id: int
+    audiobook_id: int
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    profile: str | None
+    hls: bool | None = None
+    last_error: str | None
+    next_run_at: datetime | None
+    started_at: datetime | None
+    finished_at: datetime | None
+    
+    class Config:
+        from_attributes = True
+
+
+class RenditionResponse(BaseModel):
+    name: str
+    codec: str | None
+    bitrate: int | None
+    channels: int | None
+    url: str | None
+    stream_url: str | None = None  # /api/audio/... с ETag и immutable кэшем
+    file_size: int | None
+
 
 class AudiobookResponse(BaseModel):
     id: int
@@ -26,111 +128,51 @@ class AudiobookResponse(BaseModel):
     download_progress: float
     duration: float | None
     audio_file_path: str | None
+    audio_format: str | None = None
+    hls_playlist_path: str | None = None
+    is_pinned: bool | None = False
+    play_count: int | None = 0
+    last_accessed_at: datetime | None = None
     
     class Config:
         from_attributes = True
 
 
-def download_and_convert(audiobook_id: int, db: Session):
-    """Background task для скачивания и конвертации"""
-    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
-    if not audiobook:
-        return
-    
-    try:
-        # Создаем директорию для плейлиста
-        playlist_dir = os.path.join(
-            settings.AUDIO_STORAGE_PATH,
-            f"playlist_{audiobook.playlist_id}"
-        )
-        os.makedirs(playlist_dir, exist_ok=True)
-        
-        # Безопасное имя файла
-        safe_filename = "".join(c for c in audiobook.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        output_path = os.path.join(playlist_dir, f"{safe_filename}_{audiobook.youtube_id}")
-        
-        # Скачиваем и конвертируем
-        result = youtube_service.download_audio(audiobook.video_url, output_path)
-        
-        # Конвертируем абсолютный путь в URL для API
-        # Из: /full/path/storage/audio/playlist_X/file.mp3
-        # В: /audio/playlist_X/file.mp3
-        file_path = result['file_path']
-        if settings.AUDIO_STORAGE_PATH in file_path:
-            # Получаем относительный путь от storage/audio
-            relative_path = file_path.replace(settings.AUDIO_STORAGE_PATH, '').lstrip('/')
-            audiobook.audio_file_path = f"/audio/{relative_path}"
-        else:
-            audiobook.audio_file_path = file_path
-        
-        audiobook.duration = result.get('duration')
-        audiobook.is_downloaded = True
-        audiobook.is_converted = True
-        audiobook.download_progress = 100.0
-        
-        if os.path.exists(result['file_path']):
-            audiobook.file_size = os.path.getsize(result['file_path'])
-        
-        # Генерируем AI описание
-        if not audiobook.ai_summary:
-            summary = ai_service.generate_book_summary(
-                audiobook.title,
-                audiobook.description or ""
-            )
-            if summary:
-                audiobook.ai_summary = summary
-        
-        db.commit()
-        
-        # Генерируем AI описание (отдельный коммит, чтобы не блокировать основной)
-        try:
-            if not audiobook.ai_summary:
-                summary = ai_service.generate_book_summary(
-                    audiobook.title,
-                    audiobook.description or ""
-                )
-                if summary:
-                    audiobook.ai_summary = summary
-                elif audiobook.description:
-                    # Fallback к описанию с YouTube, если AI не сработал
-                    # Берем первые 200 символов и обрезаем до ближайшего пробела
-                    desc_preview = audiobook.description[:200]
-                    if len(audiobook.description) > 200:
-                        last_space = desc_preview.rfind(' ')
-                        if last_space > 0:
-                            desc_preview = desc_preview[:last_space] + "..."
-                    audiobook.ai_summary = desc_preview
-                
-                db.commit()
-        except Exception as ai_error:
-            print(f"Error generating summary for {audiobook_id}: {ai_error}")
-            # Fallback при ошибке
-            if audiobook.description and not audiobook.ai_summary:
-                audiobook.ai_summary = audiobook.description[:150] + "..."
-                db.commit()
-        
-    except Exception as e:
-        print(f"Error downloading audiobook {audiobook_id}: {e}")
-        audiobook.download_progress = 0.0
-        audiobook.is_downloaded = False
-        db.commit()
-
-
 @router.get("/", response_model=List[AudiobookResponse])
 async def get_audiobooks(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: str | None = None,
+    sort: str = "id",
+    playlist_id: int | None = None,
+    is_downloaded: bool | None = None,
+    min_duration: float | None = None,
+    max_duration: float | None = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Получение всех аудиокниг"""
-    audiobooks = db.query(Audiobook).offset(skip).limit(limit).all()
-    return audiobooks
+    """
+    Получение аудиокниг страницами.
+    sort: id / title / duration / created_at / updated_at, с '-' по убыванию.
+    Следующая страница - тот же запрос с cursor из заголовка X-Next-Cursor.
+    """
+    return await list_audiobooks(
+        db, response,
+        playlist_id=playlist_id,
+        is_downloaded=is_downloaded,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        sort=sort,
+        cursor=cursor,
+        limit=limit,
+        skip=skip,
+    )
 
 
 @router.get("/{audiobook_id}", response_model=AudiobookResponse)
-async def get_audiobook(audiobook_id: int, db: Session = Depends(get_db)):
+async def get_audiobook(audiobook_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение информации об аудиокниге"""
-    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    audiobook = await db.get(Audiobook, audiobook_id)
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     return audiobook
@@ -139,75 +181,259 @@ async def get_audiobook(audiobook_id: int, db: Session = Depends(get_db)):
 @router.post("/{audiobook_id}/download")
 async def download_audiobook(
     audiobook_id: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    priority: int = 0,
+    profile: str | None = None,
+    renditions: str | None = None,
+    hls: bool | None = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Скачивание и конвертация аудиокниги"""
-    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    """
+    Постановка скачивания и конвертации аудиокниги в очередь.
+    profile: transcode / remux-m4a / remux-ogg / remux-webm (по умолчанию из настроек).
+    renditions: компактные версии для речи через запятую, например speech-32,speech-48
+    (по умолчанию AUDIO_RENDITIONS). Для уже скачанной книги создаются только они.
+    hls: нарезка на HLS сегменты для быстрой перемотки (по умолчанию HLS_PACKAGING).
+    """
+    audiobook = await db.get(Audiobook, audiobook_id, options=[selectinload(Audiobook.renditions)])
+    if not audiobook:
+        raise HTTPException(status_code=404, detail="Audiobook not found")
+    
+    if profile and profile not in AUDIO_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown profile. Available: {', '.join(AUDIO_PROFILES)}"
+        )
+    
+    rendition_names = None
+    if renditions is not None:
+        rendition_names = parse_renditions(renditions)
+        unknown = {name.strip() for name in renditions.split(',') if name.strip()} - set(rendition_names)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown renditions. Available: {', '.join(RENDITION_PRESETS)}"
+            )
+    
+    if audiobook.is_downloaded:
+        existing = {r.name for r in audiobook.renditions}
+        needs_renditions = rendition_names and not set(rendition_names) <= existing
+        needs_hls = hls and not audiobook.hls_playlist_path
+        if not needs_renditions and not needs_hls:
+            return {"message": "Already downloaded", "audiobook": audiobook}
+    else:
+        audiobook.download_progress = 1.0
+    
+    # Задача выполнится воркером очереди (переживает рестарт процесса)
+    job = await db.run_sync(download_queue.enqueue, audiobook_id, priority, profile, rendition_names, hls)
+    
+    return {
+        "message": "Download started",
+        "audiobook_id": audiobook_id,
+        "job_id": job.id,
+        "status": job.status
+    }
+
+
+@router.get("/{audiobook_id}/download", response_model=DownloadJobResponse)
+async def get_download_job(audiobook_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Последняя задача скачивания аудиокниги"""
+    job = await db.scalar(
+        select(DownloadJob).where(
+            DownloadJob.audiobook_id == audiobook_id
+        ).order_by(DownloadJob.id.desc()).limit(1)
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Download job not found")
+    return job
+
+
+@router.get("/{audiobook_id}/renditions", response_model=List[RenditionResponse])
+async def get_renditions(audiobook_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Доступные версии аудио: оригинал и компактные renditions"""
+    audiobook = await db.get(Audiobook, audiobook_id, options=[selectinload(Audiobook.renditions)])
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     
+    result = []
     if audiobook.is_downloaded:
-        return {"message": "Already downloaded", "audiobook": audiobook}
+        result.append(RenditionResponse(
+            name="original",
+            codec=audiobook.audio_format,
+            bitrate=None,
+            channels=None,
+            url=audiobook.audio_file_path,
+            stream_url=versioned_audio_url(audiobook.id, audiobook.audio_file_path),
+            file_size=audiobook.file_size,
+        ))
+    for rendition in sorted(audiobook.renditions, key=lambda r: r.name):
+        result.append(RenditionResponse(
+            name=rendition.name,
+            codec=rendition.codec,
+            bitrate=rendition.bitrate,
+            channels=rendition.channels,
+            url=rendition.audio_file_path,
+            stream_url=versioned_audio_url(audiobook.id, rendition.audio_file_path, rendition.name),
+            file_size=rendition.file_size,
+        ))
+    return result
+
+
+@router.get("/{audiobook_id}/hls/{filename}")
+async def get_hls_file(audiobook_id: int, filename: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    HLS плейлист (index.m3u8) и сегменты аудиокниги.
+    Сегменты неизменяемы и кэшируются навсегда, плеер и service worker
+    загружают только те, что слушаются.
+    """
+    if not HLS_FILE_RE.match(filename):
+        raise HTTPException(status_code=404, detail="HLS file not found")
+    
+    audiobook = await db.get(Audiobook, audiobook_id)
+    if not audiobook:
+        raise HTTPException(status_code=404, detail="Audiobook not found")
+    if not audiobook.hls_playlist_path:
+        raise HTTPException(status_code=404, detail="Audiobook is not packaged for HLS")
+    
+    file_path = os.path.join(os.path.dirname(from_audio_url(audiobook.hls_playlist_path)), filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="HLS file not found")
+    
+    if filename == "index.m3u8":
+        await run_in_threadpool(storage_manager.touch, audiobook_id)
+        return FileResponse(
+            file_path,
+            media_type="application/vnd.apple.mpegurl",
+            headers={"Cache-Control": "no-cache"}
+        )
+    return FileResponse(
+        file_path,
+        media_type="video/mp2t",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+
+@router.get("/{audiobook_id}/progress")
+async def stream_download_progress(audiobook_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Прогресс скачивания через Server-Sent Events.
+    Каждое событие - JSON со status (queued/downloading/converting/done/failed),
+    progress, downloaded_bytes, total_bytes, speed, eta. Поток закрывается после done/failed.
+    """
+    audiobook = await db.get(Audiobook, audiobook_id)
+    if not audiobook:
+        raise HTTPException(status_code=404, detail="Audiobook not found")
     
-    # Запускаем скачивание в фоне
-    audiobook.download_progress = 1.0
-    db.commit()
+    # Если загрузка не идёт в этом процессе (или уже завершилась и убрана
+    # из памяти трекера), первое событие берём из БД
+    initial = None
+    if progress_tracker.get(audiobook_id) is None:
+        last_job = await db.scalar(
+            select(DownloadJob).where(
+                DownloadJob.audiobook_id == audiobook_id
+            ).order_by(DownloadJob.id.desc()).limit(1)
+        )
+        error = None
+        if last_job and last_job.status in ACTIVE_STATUSES:
+            status = "queued"
+        elif audiobook.is_downloaded:
+            status = "done"
+        elif last_job and last_job.status == "failed":
+            status, error = "failed", last_job.last_error
+        else:
+            status = "idle"
+        initial = {
+            "audiobook_id": audiobook_id,
+            "status": status,
+            "progress": audiobook.download_progress,
+            "error": error,
+        }
     
-    background_tasks.add_task(download_and_convert, audiobook_id, db)
+    # SSE поток может идти долго - соединение с БД ему не нужно
+    await db.close()
     
-    return {"message": "Download started", "audiobook_id": audiobook_id}
+    async def events():
+        if initial:
+            yield f"data: {json.dumps(initial)}\n\n"
+            if initial["status"] in TERMINAL_STATUSES or initial["status"] == "idle":
+                return
+        async for state in progress_tracker.subscribe(audiobook_id):
+            if state is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"data: {json.dumps(state)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/{audiobook_id}/generate-summary")
-async def generate_summary(audiobook_id: int, db: Session = Depends(get_db)):
+async def generate_summary(audiobook_id: int, db: AsyncSession = Depends(get_async_db)):
     """Генерация AI описания для аудиокниги"""
-    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    audiobook = await db.get(Audiobook, audiobook_id)
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     
-    summary = ai_service.generate_book_summary(
+    summary = await ai_executor.run(
+        ai_service.generate_book_summary,
         audiobook.title,
         audiobook.description or ""
     )
     
     if summary:
         audiobook.ai_summary = summary
-        db.commit()
-        db.refresh(audiobook)
+        await db.commit()
+        await db.refresh(audiobook)
     
     return {"summary": summary}
 
     if summary:
         audiobook.ai_summary = summary
-        db.commit()
-        db.refresh(audiobook)
+        await db.commit()
+        await db.refresh(audiobook)
     elif audiobook.description:
         # Fallback к описанию, если AI вернул None
         audiobook.ai_summary = audiobook.description[:200] + "..."
-        db.commit()
-        db.refresh(audiobook)
+        await db.commit()
+        await db.refresh(audiobook)
         summary = audiobook.ai_summary
     
     return {"summary": summary}
 
 
+@router.put("/{audiobook_id}/pin", response_model=AudiobookResponse)
+async def pin_audiobook(audiobook_id: int, pinned: bool = True, db: AsyncSession = Depends(get_async_db)):
+    """Закрепление книги: её файлы не вытесняются при превышении квоты хранилища"""
+    audiobook = await db.get(Audiobook, audiobook_id)
+    if not audiobook:
+        raise HTTPException(status_code=404, detail="Audiobook not found")
+    
+    audiobook.is_pinned = pinned
+    await db.commit()
+    await db.refresh(audiobook)
+    return audiobook
+
+
 @router.delete("/{audiobook_id}")
-async def delete_audiobook(audiobook_id: int, db: Session = Depends(get_db)):
+async def delete_audiobook(audiobook_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление аудиокниги"""
-    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    audiobook = await db.get(Audiobook, audiobook_id)
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     
-    # Удаляем файл если он существует
-    if audiobook.audio_file_path and os.path.exists(audiobook.audio_file_path):
-        try:
-            os.remove(audiobook.audio_file_path)
-        except Exception as e:
-            print(f"Error deleting file: {e}")
-    
-    db.delete(audiobook)
-    db.commit()
+    lock = audiobook_lock(audiobook_id)
+    if not lock.acquire():
+        raise HTTPException(status_code=409, detail="Audiobook is being downloaded")
+    try:
+        # В run_sync (поток event loop) только БД; файлы удаляем в threadpool после commit
+        _, paths = await db.run_sync(storage_manager.detach_files, audiobook)
+        await db.delete(audiobook)
+        await db.commit()
+        await run_in_threadpool(storage_manager.remove_files, paths)
+    finally:
+        lock.release()
     
     return {"message": "Audiobook deleted successfully"}
 
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
 from pydantic import BaseModel
 
-from app.core.database import get_db
+from app.core.database import get_async_db
+from app.core.executors import extraction_executor
 from app.models.channel import Channel
 from app.models.playlist import Playlist
-from app.services.youtube_service import youtube_service
+from app.models.audiobook import Audiobook
+from app.services.youtube_service import youtube_service, AUDIO_PROFILES
+from app.services.download_queue import download_queue
 from app.services.ai_service import ai_service
+from app.services.sync_service import sync_service
+from app.services.ingest_service import ingest_service
 
 router = APIRouter()
 
@@ -40,21 +47,38 @@ class PlaylistResponse(BaseModel):
         from_attributes = True
 
 
+def store_channel_playlists(db: Session, channel_id: int, playlists_data: List[dict]) -> dict:
+    """Массовая запись плейлистов канала (без commit): новые добавляются, у известных обновляются title/thumbnail"""
+    rows = [
+        {
+            **playlist_data,
+            # Не используем AI для извлечения автора при добавлении
+            # (можно сделать позже через отдельный endpoint)
+            'author': None,
+            'channel_id': channel_id,
+        }
+        for playlist_data in playlists_data
+    ]
+    return ingest_service.upsert(db, Playlist, rows)
+
+
 @router.post("/", response_model=ChannelResponse)
-async def add_channel(channel_data: ChannelCreate, db: Session = Depends(get_db)):
+async def add_channel(channel_data: ChannelCreate, db: AsyncSession = Depends(get_async_db)):
     """Добавление YouTube канала и парсинг его плейлистов"""
     try:
         print(f"[DEBUG] Получен запрос на добавление канала: {channel_data.url}")
         
         # Получаем информацию о канале
         print("[DEBUG] Получение информации о канале...")
-        channel_info = youtube_service.get_channel_info(channel_data.url)
+        channel_info = await extraction_executor.run(
+            youtube_service.get_channel_info, channel_data.url
+        )
         print(f"[DEBUG] Канал найден: {channel_info.get('title')}")
         
         # Проверяем, не добавлен ли уже этот канал
-        existing_channel = db.query(Channel).filter(
-            Channel.youtube_id == channel_info['youtube_id']
-        ).first()
+        existing_channel = await db.scalar(
+            select(Channel).where(Channel.youtube_id == channel_info['youtube_id'])
+        )
         
         if existing_channel:
             print(f"[DEBUG] Канал уже существует: {existing_channel.title}")
@@ -63,75 +87,64 @@ async def add_channel(channel_data: ChannelCreate, db: Session = Depends(get_db)
         # Создаем канал
         channel = Channel(**channel_info)
         db.add(channel)
-        db.commit()
-        db.refresh(channel)
+        await db.commit()
+        await db.refresh(channel)
         print(f"[DEBUG] Канал создан с ID: {channel.id}")
         
         # Парсим плейлисты канала (это может занять время)
         print("[DEBUG] Парсинг плейлистов...")
-        playlists_data = youtube_service.get_channel_playlists(channel_data.url)
+        playlists_data = await extraction_executor.run(
+            youtube_service.get_channel_playlists, channel_data.url
+        )
         print(f"[DEBUG] Найдено плейлистов: {len(playlists_data)}")
         
-        for idx, playlist_data in enumerate(playlists_data):
-            print(f"[DEBUG] Обработка плейлиста {idx+1}/{len(playlists_data)}: {playlist_data['title']}")
-            
-            # Не используем AI для извлечения автора при первом добавлении
-            # (можно сделать позже через отдельный endpoint)
-            playlist_data['author'] = None
-            playlist_data['channel_id'] = channel.id
-            
-            # Проверяем, не существует ли уже такой плейлист
-            existing_playlist = db.query(Playlist).filter(
-                Playlist.youtube_id == playlist_data['youtube_id']
-            ).first()
-            
-            if not existing_playlist:
-                playlist = Playlist(**playlist_data)
-                db.add(playlist)
-        
-        db.commit()
-        print("[DEBUG] Все плейлисты сохранены")
+        stats = await db.run_sync(store_channel_playlists, channel.id, playlists_data)
+        await db.commit()
+        print(f"[DEBUG] Все плейлисты сохранены: {stats}")
         
         return channel
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] Ошибка при добавлении канала: {str(e)}")
         import traceback
         traceback.print_exc()
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Error adding channel: {str(e)}")
 
 
 @router.get("/", response_model=List[ChannelResponse])
-async def get_channels(db: Session = Depends(get_db)):
+async def get_channels(db: AsyncSession = Depends(get_async_db)):
     """Получение всех добавленных каналов"""
-    channels = db.query(Channel).all()
+    channels = (await db.scalars(select(Channel))).all()
     return channels
 
 
 @router.get("/{channel_id}", response_model=ChannelResponse)
-async def get_channel(channel_id: int, db: Session = Depends(get_db)):
+async def get_channel(channel_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение информации о канале"""
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    channel = await db.get(Channel, channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     return channel
 
 
 @router.get("/{channel_id}/playlists", response_model=List[PlaylistResponse])
-async def get_channel_playlists(channel_id: int, db: Session = Depends(get_db)):
+async def get_channel_playlists(channel_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение всех плейлистов канала"""
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    channel = await db.get(Channel, channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
-    return channel.playlists
+    playlists = await db.scalars(select(Playlist).where(Playlist.channel_id == channel_id))
+    return playlists.all()
 
 
 @router.post("/{channel_id}/sync-playlists")
-async def sync_channel_playlists(channel_id: int, db: Session = Depends(get_db)):
+async def sync_channel_playlists(channel_id: int, db: AsyncSession = Depends(get_async_db)):
     """Принудительная синхронизация плейлистов канала"""
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    channel = await db.get(Channel, channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
@@ -139,50 +152,141 @@ async def sync_channel_playlists(channel_id: int, db: Session = Depends(get_db))
         print(f"[DEBUG] Синхронизация плейлистов для канала: {channel.title}")
         
         # Парсим плейлисты канала
-        playlists_data = youtube_service.get_channel_playlists(channel.channel_url)
+        playlists_data = await extraction_executor.run(
+            youtube_service.get_channel_playlists, channel.channel_url
+        )
         print(f"[DEBUG] Найдено плейлистов: {len(playlists_data)}")
         
-        added_count = 0
-        for playlist_data in playlists_data:
-            # Проверяем, не существует ли уже такой плейлист
-            existing_playlist = db.query(Playlist).filter(
-                Playlist.youtube_id == playlist_data['youtube_id']
-            ).first()
-            
-            if not existing_playlist:
-                playlist_data['author'] = None
-                playlist_data['channel_id'] = channel.id
-                playlist = Playlist(**playlist_data)
-                db.add(playlist)
-                added_count += 1
-                print(f"[DEBUG] Добавлен новый плейлист: {playlist_data['title']}")
-        
-        db.commit()
-        print(f"[DEBUG] Синхронизация завершена. Добавлено новых плейлистов: {added_count}")
+        stats = await db.run_sync(store_channel_playlists, channel.id, playlists_data)
+        await db.commit()
+        print(f"[DEBUG] Синхронизация завершена. Добавлено новых плейлистов: {stats['inserted']}")
         
         return {
             "message": "Playlists synced successfully",
             "total_found": len(playlists_data),
-            "added": added_count
+            "added": stats['inserted'],
+            "updated": stats['updated'],
+            "unchanged": stats['unchanged']
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] Ошибка синхронизации плейлистов: {str(e)}")
         import traceback
         traceback.print_exc()
-        db.rollback()
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error syncing playlists: {str(e)}")
+
+
+@router.post("/{channel_id}/deep-sync")
+async def deep_sync_channel(
+    channel_id: int,
+    concurrency: int | None = None,
+    full: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Полная синхронизация канала: обновление списка плейлистов и
+    параллельная загрузка видео всех плейлистов (ошибки изолированы по плейлистам)
+    """
+    channel = await db.get(Channel, channel_id)
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    try:
+        print(f"[DEBUG] Deep sync канала: {channel.title}")
+        
+        playlists_data = await extraction_executor.run(
+            youtube_service.get_channel_playlists, channel.channel_url
+        )
+        
+        stats = await db.run_sync(store_channel_playlists, channel.id, playlists_data)
+        await db.commit()
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Ошибка синхронизации плейлистов: {str(e)}")
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Error syncing playlists: {str(e)}")
+    
+    playlists = [
+        {"id": p.id, "title": p.title, "playlist_url": p.playlist_url}
+        for p in await db.scalars(select(Playlist).where(Playlist.channel_id == channel.id))
+    ]
+    results = await sync_service.sync_playlists(playlists, concurrency, full)
+    
+    failed = [r for r in results if 'error' in r]
+    print(f"[DEBUG] Deep sync завершён: {len(playlists)} плейлистов, ошибок: {len(failed)}")
+    
+    return {
+        "message": "Channel deep sync finished",
+        "playlists_added": stats['inserted'],
+        "playlists_synced": len(playlists) - len(failed),
+        "playlists_failed": len(failed),
+        "audiobooks_added": sum(r.get('added', 0) for r in results),
+        "results": results
+    }
+
+
+@router.post("/{channel_id}/download-all")
+async def download_channel(
+    channel_id: int,
+    priority: int = 0,
+    profile: str | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Постановка в очередь всех нескачанных аудиокниг всех плейлистов канала.
+    Одновременность ограничена DOWNLOAD_WORKERS, скорость - DOWNLOAD_BANDWIDTH_LIMIT.
+    """
+    channel = await db.get(Channel, channel_id)
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    if profile and profile not in AUDIO_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown profile. Available: {', '.join(AUDIO_PROFILES)}"
+        )
+    
+    audiobook_ids = (await db.scalars(
+        select(Audiobook.id).join(Playlist).where(
+            Playlist.channel_id == channel_id,
+            Audiobook.is_downloaded == False
+        )
+    )).all()
+    result = await db.run_sync(download_queue.enqueue_many, list(audiobook_ids), priority, profile)
+    
+    return {
+        "message": f"Queued {result['queued']} audiobooks",
+        **result
+    }
+
+
+@router.get("/{channel_id}/download-progress")
+async def get_channel_download_progress(channel_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Сводный прогресс скачивания канала: счётчики, процент, скорость, ETA"""
+    channel = await db.get(Channel, channel_id)
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    audiobook_ids = (await db.scalars(
+        select(Audiobook.id).join(Playlist).where(Playlist.channel_id == channel_id)
+    )).all()
+    return await db.run_sync(download_queue.aggregate_progress, list(audiobook_ids))
 
 
 @router.delete("/{channel_id}")
-async def delete_channel(channel_id: int, db: Session = Depends(get_db)):
+async def delete_channel(channel_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление канала"""
-    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    channel = await db.get(Channel, channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
-    db.delete(channel)
-    db.commit()
+    await db.delete(channel)
+    await db.commit()
     
     return {"message": "Channel deleted successfully"}
 
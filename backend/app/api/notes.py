@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from pydantic import BaseModel
 import json
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.models.note import Note
 from app.models.audiobook import Audiobook
 
@@ -30,24 +31,25 @@ class NoteResponse(BaseModel):
     quote: str | None
     timestamp: float | None
     audiobook_id: int
-    ai_discussion: str | None
+    ai_discussion: str | None  # устаревшее, история в /api/ai/discussion/{note_id}
+    discussion_count: int = 0
     
     class Config:
         from_attributes = True
 
 
 @router.post("/", response_model=NoteResponse)
-async def create_note(note_data: NoteCreate, db: Session = Depends(get_db)):
+async def create_note(note_data: NoteCreate, db: AsyncSession = Depends(get_async_db)):
     """Создание заметки"""
     # Проверяем существование аудиокниги
-    audiobook = db.query(Audiobook).filter(Audiobook.id == note_data.audiobook_id).first()
+    audiobook = await db.get(Audiobook, note_data.audiobook_id)
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     
     note = Note(**note_data.dict())
     db.add(note)
-    db.commit()
-    db.refresh(note)
+    await db.commit()
+    await db.refresh(note)
     
     return note
 
@@ -55,22 +57,22 @@ async def create_note(note_data: NoteCreate, db: Session = Depends(get_db)):
 @router.get("/", response_model=List[NoteResponse])
 async def get_notes(
     audiobook_id: int | None = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получение заметок (опционально по аудиокниге)"""
-    query = db.query(Note)
+    query = select(Note)
     
     if audiobook_id:
-        query = query.filter(Note.audiobook_id == audiobook_id)
+        query = query.where(Note.audiobook_id == audiobook_id)
     
-    notes = query.all()
+    notes = (await db.scalars(query)).all()
     return notes
 
 
 @router.get("/{note_id}", response_model=NoteResponse)
-async def get_note(note_id: int, db: Session = Depends(get_db)):
+async def get_note(note_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение конкретной заметки"""
-    note = db.query(Note).filter(Note.id == note_id).first()
+    note = await db.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     return note
@@ -80,10 +82,10 @@ async def get_note(note_id: int, db: Session = Depends(get_db)):
 async def update_note(
     note_id: int,
     note_data: NoteUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Обновление заметки"""
-    note = db.query(Note).filter(Note.id == note_id).first()
+    note = await db.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
@@ -91,21 +93,21 @@ async def update_note(
     for field, value in update_data.items():
         setattr(note, field, value)
     
-    db.commit()
-    db.refresh(note)
+    await db.commit()
+    await db.refresh(note)
     
     return note
 
 
 @router.delete("/{note_id}")
-async def delete_note(note_id: int, db: Session = Depends(get_db)):
+async def delete_note(note_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление заметки"""
-    note = db.query(Note).filter(Note.id == note_id).first()
+    note = await db.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    db.delete(note)
-    db.commit()
+    await db.delete(note)
+    await db.commit()
     
     return {"message": "Note deleted successfully"}
 
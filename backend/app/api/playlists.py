@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from pydantic import BaseModel
 
-from app.core.database import get_db
+from app.api.audiobooks import list_audiobooks
+from app.core.database import get_async_db
+from app.core.executors import extraction_executor
 from app.models.playlist import Playlist
 from app.models.audiobook import Audiobook
-from app.services.youtube_service import youtube_service
+from app.services.youtube_service import AUDIO_PROFILES
+from app.services.sync_service import sync_service
+from app.services.download_queue import download_queue
 from app.services.ai_service import ai_service
 
 router = APIRouter()
@@ -42,16 +47,16 @@ class AudiobookResponse(BaseModel):
 
 
 @router.get("/", response_model=List[PlaylistResponse])
-async def get_playlists(db: Session = Depends(get_db)):
+async def get_playlists(db: AsyncSession = Depends(get_async_db)):
     """Получение всех плейлистов"""
-    playlists = db.query(Playlist).all()
+    playlists = (await db.scalars(select(Playlist))).all()
     return playlists
 
 
 @router.get("/{playlist_id}", response_model=PlaylistResponse)
-async def get_playlist(playlist_id: int, db: Session = Depends(get_db)):
+async def get_playlist(playlist_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получение информации о плейлисте"""
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+    playlist = await db.get(Playlist, playlist_id)
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
     return playlist
@@ -60,66 +65,123 @@ async def get_playlist(playlist_id: int, db: Session = Depends(get_db)):
 @router.post("/{playlist_id}/sync")
 async def sync_playlist(
     playlist_id: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    full: bool = False,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Синхронизация плейлиста - загрузка информации о всех видео"""
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+    """
+    Синхронизация плейлиста - загрузка информации о видео.
+    По умолчанию incremental (только новые видео), full=true - полный обход.
+    """
+    playlist = await db.get(Playlist, playlist_id)
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
     
     try:
-        # Получаем все видео из плейлиста
-        videos = youtube_service.get_playlist_videos(playlist.playlist_url)
+        result = await extraction_executor.run(sync_service.sync_playlist, playlist.id, full)
         
-        for video_data in videos:
-            # Проверяем, не существует ли уже такое видео
-            existing_audiobook = db.query(Audiobook).filter(
-                Audiobook.youtube_id == video_data['youtube_id']
-            ).first()
-            
-            if not existing_audiobook:
-                audiobook = Audiobook(
-                    youtube_id=video_data['youtube_id'],
-                    title=video_data['title'],
-                    description=video_data.get('description'),
-                    thumbnail_url=video_data.get('thumbnail_url'),
-                    video_url=video_data['video_url'],
-                    duration=video_data.get('duration'),
-                    playlist_id=playlist.id,
-                    is_downloaded=False,
-                    is_converted=False,
-                )
-                db.add(audiobook)
-        
-        db.commit()
-        
-        return {"message": f"Synced {len(videos)} videos", "count": len(videos)}
+        return {
+            "message": f"Synced {result['found']} videos",
+            "count": result['found'],
+            "added": result['added'],
+            "updated": result['updated'],
+            "mode": result['mode']
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=400, detail=f"Error syncing playlist: {str(e)}")
 
 
 @router.get("/{playlist_id}/audiobooks", response_model=List[AudiobookResponse])
-async def get_playlist_audiobooks(playlist_id: int, db: Session = Depends(get_db)):
-    """Получение всех аудиокниг плейлиста"""
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+async def get_playlist_audiobooks(
+    playlist_id: int,
+    response: Response,
+    limit: int | None = None,
+    cursor: str | None = None,
+    sort: str = "id",
+    is_downloaded: bool | None = None,
+    min_duration: float | None = None,
+    max_duration: float | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Получение аудиокниг плейлиста (индекс playlist_id, id).
+    Без limit - весь плейлист, с limit - страницы по курсору из X-Next-Cursor.
+    """
+    playlist = await db.get(Playlist, playlist_id)
+    if not playlist:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    
+    return await list_audiobooks(
+        db, response,
+        playlist_id=playlist_id,
+        is_downloaded=is_downloaded,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        sort=sort,
+        cursor=cursor,
+        limit=limit,
+    )
+
+
+@router.post("/{playlist_id}/download-all")
+async def download_playlist(
+    playlist_id: int,
+    priority: int = 0,
+    profile: str | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Постановка в очередь всех нескачанных аудиокниг плейлиста.
+    Одновременность ограничена DOWNLOAD_WORKERS, скорость - DOWNLOAD_BANDWIDTH_LIMIT.
+    """
+    playlist = await db.get(Playlist, playlist_id)
+    if not playlist:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    
+    if profile and profile not in AUDIO_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown profile. Available: {', '.join(AUDIO_PROFILES)}"
+        )
+    
+    audiobook_ids = (await db.scalars(
+        select(Audiobook.id).where(
+            Audiobook.playlist_id == playlist_id,
+            Audiobook.is_downloaded == False
+        )
+    )).all()
+    result = await db.run_sync(download_queue.enqueue_many, list(audiobook_ids), priority, profile)
+    
+    return {
+        "message": f"Queued {result['queued']} audiobooks",
+        **result
+    }
+
+
+@router.get("/{playlist_id}/download-progress")
+async def get_playlist_download_progress(playlist_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Сводный прогресс скачивания плейлиста: счётчики, процент, скорость, ETA"""
+    playlist = await db.get(Playlist, playlist_id)
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
     
-    return playlist.audiobooks
+    audiobook_ids = (await db.scalars(
+        select(Audiobook.id).where(Audiobook.playlist_id == playlist_id)
+    )).all()
+    return await db.run_sync(download_queue.aggregate_progress, list(audiobook_ids))
 
 
 @router.delete("/{playlist_id}")
-async def delete_playlist(playlist_id: int, db: Session = Depends(get_db)):
+async def delete_playlist(playlist_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удаление плейлиста"""
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+    playlist = await db.get(Playlist, playlist_id)
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
     
-    db.delete(playlist)
-    db.commit()
+    await db.delete(playlist)
+    await db.commit()
     
     return {"message": "Playlist deleted successfully"}
 
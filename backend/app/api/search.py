@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from pydantic import BaseModel
+
+from app.core.database import get_async_db
+from app.services.search_service import search_service, SEARCH_SOURCES
+
+router = APIRouter()
+
+MAX_SEARCH_RESULTS = 100
+
+
+class SearchResult(BaseModel):
+    kind: str  # audiobook / playlist / note
+    id: int
+    parent_id: int | None  # playlist_id аудиокниги, channel_id плейлиста, audiobook_id заметки
+    title: str | None
+    snippet: str | None  # фрагмент текста, совпадения в <mark>
+    rank: float
+
+
+@router.get("/", response_model=List[SearchResult])
+async def search(
+    q: str,
+    kind: str | None = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Полнотекстовый поиск по аудиокнигам, плейлистам и заметкам, по убыванию релевантности.
+    kind: audiobook,playlist,note через запятую (по умолчанию все).
+    """
+    kinds = [k.strip() for k in kind.split(',') if k.strip()] if kind else list(SEARCH_SOURCES)
+    unknown = set(kinds) - set(SEARCH_SOURCES)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown kind. Available: {', '.join(SEARCH_SOURCES)}"
+        )
+    
+    try:
+        return await search_service.search(db, q, kinds, min(max(limit, 1), MAX_SEARCH_RESULTS))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
@@ -0,0 +1,50 @@
+from typing import List
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.database import SessionLocal, get_async_db
+from app.services.storage_manager import storage_manager
+from app.services.storage_reconciler import storage_reconciler
+
+router = APIRouter()
+
+
+def _enforce_quota() -> List[int]:
+    """enforce_quota удаляет файлы - выполняется в threadpool со своей синхронной сессией"""
+    db = SessionLocal()
+    try:
+        return storage_manager.enforce_quota(db)
+    finally:
+        db.close()
+
+
+@router.get("/")
+async def get_storage_stats(db: AsyncSession = Depends(get_async_db)):
+    """Занятое место, квота и количество закреплённых книг"""
+    return await db.run_sync(storage_manager.stats)
+
+
+@router.post("/evict")
+async def evict_storage(db: AsyncSession = Depends(get_async_db)):
+    """Принудительное вытеснение давно не слушанных книг до размера квоты"""
+    evicted = await run_in_threadpool(_enforce_quota)
+    return {
+        "message": f"Evicted {len(evicted)} audiobooks",
+        "evicted": evicted,
+        **(await db.run_sync(storage_manager.stats))
+    }
+
+
+@router.post("/reconcile")
+async def reconcile_storage():
+    """Внеочередная сверка хранилища с БД (выполняется в фоне)"""
+    storage_reconciler.trigger()
+    return {"message": "Reconcile started", "last_run": storage_reconciler.last_run}
+
+
+@router.get("/reconcile")
+async def get_reconcile_status():
+    """Результат последней сверки хранилища"""
+    return {"last_run": storage_reconciler.last_run}
@@ -1,101 +1,129 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse, StreamingResponse
-from sqlalchemy.orm import Session
-import yt_dlp
+from sqlalchemy.ext.asyncio import AsyncSession
+import httpx
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.core.executors import extraction_executor
 from app.models.audiobook import Audiobook
+from app.services.stream_cache import StreamEntry, stream_url_cache
+from app.services.storage_manager import storage_manager
+from app.services.stream_proxy import StreamProxy
+from app.services.youtube_service import youtube_service
 
 router = APIRouter()
 
 
+def _stream_resolver(youtube_id: str, video_url: str):
+    """Resolver для прокси: force=True сбрасывает закэшированный URL (после 403)"""
+    async def resolve(force: bool) -> StreamEntry:
+        if force:
+            stream_url_cache.invalidate(youtube_id)
+        return await stream_url_cache.resolve(
+            youtube_id,
+            lambda: youtube_service.get_stream_url(video_url)
+        )
+    return resolve
+
+
 @router.get("/stream/{audiobook_id}")
-async def stream_audio(audiobook_id: int, db: Session = Depends(get_db)):
+async def stream_audio(
+    audiobook_id: int,
+    request: Request,
+    proxy: bool | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Получить stream URL для аудио без скачивания файла.
-    Возвращает redirect на прямой YouTube audio stream.
+    По умолчанию возвращает redirect на прямой YouTube audio stream,
+    в режиме proxy (?proxy=true или STREAM_PROXY_MODE) отдаёт аудио через сервер.
+    URL кэшируется до истечения параметра expire.
     """
     # Получаем audiobook
-    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    audiobook = await db.get(Audiobook, audiobook_id)
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
+    # Соединение возвращается в пул до начала стрима, а не после его окончания
+    await db.close()
+    
+    await run_in_threadpool(storage_manager.touch, audiobook_id)
+    
+    use_proxy = settings.STREAM_PROXY_MODE if proxy is None else proxy
+    if use_proxy:
+        stream_proxy = StreamProxy(_stream_resolver(audiobook.youtube_id, audiobook.video_url))
+        try:
+            return await stream_proxy.open(request.headers)
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except httpx.HTTPError as e:
+            print(f"Error proxying stream: {e}")
+            raise HTTPException(status_code=502, detail=f"Upstream stream error: {str(e)}")
+        except Exception as e:
+            print(f"Error proxying stream: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to proxy stream: {str(e)}")
     
     try:
-        # Опции для получения stream URL без скачивания
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,  # Нужна полная информация
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Получаем информацию о видео
-            info = ydl.extract_info(audiobook.video_url, download=False)
-            
-            # Получаем прямой URL на аудио stream
-            if 'url' in info:
-                stream_url = info['url']
-            elif 'formats' in info:
-                # Находим лучший аудио формат
-                audio_formats = [f for f in info['formats'] if f.get('acodec') != 'none']
-                if audio_formats:
-                    # Берём формат с лучшим битрейтом
-                    best_audio = max(audio_formats, key=lambda f: f.get('abr', 0) or 0)
-                    stream_url = best_audio['url']
-                else:
-                    raise HTTPException(status_code=404, detail="No audio stream found")
-            else:
-                raise HTTPException(status_code=404, detail="Stream URL not available")
-            
-            # Возвращаем redirect на stream URL
-            # YouTube stream URLs временные, действуют несколько часов
-            return RedirectResponse(url=stream_url)
-            
+        entry = await stream_url_cache.resolve(
+            audiobook.youtube_id,
+            lambda: youtube_service.get_stream_url(audiobook.video_url)
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         print(f"Error getting stream URL: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get stream URL: {str(e)}"
         )
+    
+    # Возвращаем redirect на stream URL
+    # YouTube stream URLs временные, клиент может кэшировать redirect до их истечения
+    return RedirectResponse(
+        url=entry.url,
+        headers={"Cache-Control": f"private, max-age={stream_url_cache.max_age(entry)}"}
+    )
 
 
 @router.get("/stream-info/{audiobook_id}")
-async def get_stream_info(audiobook_id: int, db: Session = Depends(get_db)):
+async def get_stream_info(audiobook_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Получить информацию о stream (для debugging).
     Возвращает доступные форматы и URLs.
     """
-    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    audiobook = await db.get(Audiobook, audiobook_id)
     if not audiobook:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'quiet': True,
-            'no_warnings': True,
-        }
+        # Та же общая extraction, что и у stream/download
+        info = await extraction_executor.run(
+            youtube_service.extract_video_info, audiobook.video_url
+        )
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(audiobook.video_url, download=False)
-            
-            # Возвращаем полезную информацию
-            return {
-                "title": info.get('title'),
-                "duration": info.get('duration'),
-                "formats_count": len(info.get('formats', [])),
-                "has_direct_url": 'url' in info,
-                "audio_formats": [
-                    {
-                        "format_id": f.get('format_id'),
-                        "ext": f.get('ext'),
-                        "abr": f.get('abr'),
-                        "filesize": f.get('filesize'),
-                    }
-                    for f in info.get('formats', [])
-                    if f.get('acodec') != 'none'
-                ][:5]  # Показываем только топ-5
-            }
+        # Возвращаем полезную информацию
+        return {
+            "title": info.get('title'),
+            "duration": info.get('duration'),
+            "formats_count": len(info.get('formats', [])),
+            "has_direct_url": 'url' in info,
+            "audio_formats": [
+                {
+                    "format_id": f.get('format_id'),
+                    "ext": f.get('ext'),
+                    "abr": f.get('abr'),
+                    "filesize": f.get('filesize'),
+                }
+                for f in info.get('formats', [])
+                if f.get('acodec') != 'none'
+            ][:5]  # Показываем только топ-5
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
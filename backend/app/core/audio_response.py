@@ -0,0 +1,134 @@
+import hashlib
+import os
+from typing import Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """
+    Strong ETag по inode, размеру и mtime. Файлы пишутся во временный
+    и подменяются rename, поэтому новое содержимое всегда даёт новый ETag.
+    """
+    key = f"{stat_result.st_ino}-{stat_result.st_size}-{stat_result.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    'bytes=0-99' / 'bytes=100-' / 'bytes=-100' -> (start, end) включительно.
+    None - заголовок не поддерживается (несколько диапазонов): отдаётся весь файл.
+    ValueError - диапазон невыполним (416).
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    start_text, _, end_text = spec.strip().partition('-')
+    try:
+        if not start_text:
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise ValueError("Empty suffix range")
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(start_text)
+            end = min(int(end_text), size - 1) if end_text else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {header}")
+
+    if start >= size or start > end:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return start, end
+
+
+class AudioFileResponse(Response):
+    """
+    Отдача аудиофайла: ETag / If-None-Match (304), Range / If-Range (206, 416)
+    и zero-copy sendfile через ASGI extension http.response.zerocopysend,
+    если сервер его поддерживает (иначе чтение чанками в пуле потоков).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        stat_result: os.stat_result,
+        request_headers: Mapping[str, str],
+        media_type: str,
+        cache_control: str,
+        method: str = "GET",
+    ):
+        super().__init__(media_type=media_type)
+        self.path = path
+        self.send_body = method != "HEAD"
+        size = stat_result.st_size
+        etag = f'"{file_etag(stat_result)}"'
+
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = etag
+        self.headers["cache-control"] = cache_control
+        self.start, self.end = 0, size - 1
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            self.status_code = 304
+            self.start, self.end = 0, -1
+            self.headers["content-length"] = "0"
+            return
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (not if_range or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.start, self.end = 0, -1
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                return
+            if byte_range:
+                self.status_code = 206
+                self.start, self.end = byte_range
+                self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+        self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        count = self.end - self.start + 1
+        if not self.send_body or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -6,20 +6,79 @@ import os
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./audiobooks.db"
+    # SQLite production профиль: WAL, pragmas, пул читателей, один писатель
+    SQLITE_PRODUCTION_PROFILE: bool = True
+    SQLITE_BUSY_TIMEOUT: int = 5000  # мс
+    SQLITE_CACHE_SIZE_KB: int = 64000  # кэш страниц на соединение
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # байт
+    SQLITE_POOL_SIZE: int = 10
+    # Пул соединений PostgreSQL (на каждый engine: sync для воркеров, async для API)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
     
     # OpenAI
     OPENAI_API_KEY: Optional[str] = None
     
     # YouTube
     YOUTUBE_COOKIE_FILE: Optional[str] = None
+    YDL_POOL_MAX_IDLE: int = 4  # свободных экземпляров YoutubeDL на профиль
     
     # Storage
     AUDIO_STORAGE_PATH: str = "./storage/audio"
     TEMP_STORAGE_PATH: str = "./storage/temp"
+    STORAGE_QUOTA_BYTES: int = 0  # лимит AUDIO_STORAGE_PATH, 0 - без лимита
+    STORAGE_ACCESS_WRITE_INTERVAL: float = 60.0  # не чаще одной записи last_accessed_at за N секунд
+    STORAGE_RECONCILE_INTERVAL: int = 3600  # секунд между проходами сверки хранилища, 0 - отключено
+    STORAGE_RECONCILE_BATCH: int = 200  # файлов/строк за один шаг сверки
+    STORAGE_ORPHAN_GRACE: int = 3600  # секунд: более свежие файлы без записи в БД не удаляются
     
     # Audio settings
     AUDIO_FORMAT: str = "mp3"
     AUDIO_QUALITY: str = "192"  # kbps
+    # transcode - перекодирование в AUDIO_FORMAT;
+    # remux-m4a / remux-ogg / remux-webm - исходный поток без перекодирования
+    AUDIO_STORAGE_PROFILE: str = "transcode"
+    # Дополнительные renditions для речи через запятую: speech-32,speech-48,speech-64-aac
+    AUDIO_RENDITIONS: str = ""
+    # HLS: короткие сегменты + index.m3u8 для быстрой перемотки длинных книг
+    HLS_PACKAGING: bool = False
+    HLS_SEGMENT_SECONDS: int = 10
+    
+    # Stream
+    STREAM_CACHE_SIZE: int = 512  # количество закэшированных stream URL
+    STREAM_URL_REFRESH_MARGIN: int = 300  # секунд до expire, когда обновляем URL
+    STREAM_URL_DEFAULT_TTL: int = 3600  # если в URL нет параметра expire
+    STREAM_PROXY_MODE: bool = False  # проксировать аудио вместо redirect
+    STREAM_PROXY_CHUNK_SIZE: int = 64 * 1024  # байт
+    STREAM_PROXY_MAX_CONNECTIONS: int = 50
+    STREAM_PROXY_MAX_RETRIES: int = 3
+    STREAM_PROXY_TIMEOUT: float = 30.0  # секунд
+    
+    # Executors (блокирующие вызовы yt-dlp / OpenAI)
+    EXTRACTION_WORKERS: int = 4
+    EXTRACTION_QUEUE_SIZE: int = 32
+    AI_WORKERS: int = 4
+    AI_QUEUE_SIZE: int = 16
+    
+    # Sync
+    CHANNEL_SYNC_CONCURRENCY: int = 3  # плейлистов одновременно при deep sync (не больше EXTRACTION_WORKERS - 1)
+    SYNC_HEAD_SIZE: int = 50  # видео в первой странице для incremental sync
+    SYNC_BATCH_SIZE: int = 200  # видео на один commit при синхронизации
+    INGEST_BATCH_SIZE: int = 500  # строк на один IN/INSERT при массовой записи
+    
+    # Download queue
+    DOWNLOAD_WORKERS: int = 2  # одновременных загрузок (сеть)
+    TRANSCODE_WORKERS: int = os.cpu_count() or 2  # одновременных конвертаций ffmpeg (CPU)
+    TRANSCODE_QUEUE_SIZE: int = 4  # скачанных файлов в ожидании конвертации
+    DOWNLOAD_MAX_ATTEMPTS: int = 3
+    DOWNLOAD_RETRY_BACKOFF: int = 30  # секунд, удваивается с каждой попыткой
+    DOWNLOAD_RETRY_BACKOFF_MAX: int = 3600
+    DOWNLOAD_QUEUE_POLL_INTERVAL: float = 5.0  # секунд
+    DOWNLOAD_HEARTBEAT_INTERVAL: float = 30.0  # секунд между отметками живых задач процесса
+    DOWNLOAD_HEARTBEAT_TIMEOUT: float = 120.0  # running задача без отметки дольше - владелец умер
+    DOWNLOAD_BANDWIDTH_LIMIT: int = 0  # байт/с на все загрузки вместе, 0 - без лимита
+    DOWNLOAD_DURATION_TOLERANCE: float = 5.0  # секунд расхождения длительности файла и видео
+    PROGRESS_DB_INTERVAL: float = 5.0  # не чаще одной записи прогресса в БД за N секунд
     
     # API
     API_V1_STR: str = "/api"
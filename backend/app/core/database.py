@@ -1,16 +1,267 @@
-from sqlalchemy import create_engine
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.util import await_only
 
 from app.core.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "ALTER", "DROP")
+
+
+class SQLiteWriteLock:
+    """
+    Единственный путь записи в SQLite внутри процесса.
+    Соединение берёт блокировку на первом пишущем запросе и отпускает при
+    возврате в пул (Session возвращает соединение после commit/rollback),
+    то есть уже после завершения COMMIT. Писатели ждут
+    здесь, а не крутятся в busy_timeout, читатели в WAL не блокируются.
+    Писатели async engine (API) приходят сюда через AsyncSQLiteWriteLock.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._owner = None
+        self._count = 0
+        self._waiters: deque = deque()
+
+    def install(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine.pool, "reset", self._on_reset)
+        event.listen(engine.pool, "checkin", self._on_checkin)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("holds_write_lock") or not is_write_statement(statement):
+            return
+        # Не дождались - пишем всё равно, дальше ждёт busy_timeout самого SQLite
+        conn.info["holds_write_lock"] = self.acquire()
+
+    def _on_reset(self, dbapi_connection, connection_record, reset_state):
+        if connection_record.info.pop("holds_write_lock", False):
+            self.release()
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        if connection_record is not None and connection_record.info.pop("holds_write_lock", False):
+            self.release()
+
+    def acquire(self, owner=None) -> bool:
+        # Реентерабельно для владельца (по умолчанию - поток: async эндпоинты
+        # без AsyncSQLiteWriteLock делят поток event loop), но отпускать можно
+        # из любого потока (закрытие сессии в threadpool)
+        me = owner if owner is not None else threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._count += 1
+                return True
+            # Очередь FIFO: иначе только что отпустивший блокировку поток сразу
+            # забирает её снова, и остальные писатели (в том числе API) голодают
+            ticket = object()
+            self._waiters.append(ticket)
+            if not self._cond.wait_for(lambda: self._owner is None and self._waiters[0] is ticket, self.timeout):
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+                return False
+            self._waiters.popleft()
+            self._owner = me
+            self._count = 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._count -= 1
+            if self._count <= 0:
+                self._owner = None
+                self._count = 0
+                self._cond.notify_all()
+
+
+class AsyncSQLiteWriteLock:
+    """
+    Запись через async engine (API) через тот же SQLiteWriteLock, что и у
+    sync engine: воркеры и API пишут по очереди, а не ловят SQLITE_BUSY.
+    Ждать threading блокировку в event loop нельзя, поэтому async писатели
+    выстраиваются в asyncio.Lock, и общую блокировку в отдельном потоке ждёт
+    только первый из них. before_cursor_execute - синхронный хук, но выполняется
+    в greenlet async сессии, поэтому ожидание идёт через await_only.
+    """
+
+    def __init__(self, write_lock: SQLiteWriteLock):
+        self.write_lock = write_lock
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def install(self, engine: AsyncEngine):
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine.sync_engine.pool, "reset", self._on_reset)
+        event.listen(engine.sync_engine.pool, "checkin", self._on_checkin)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if "async_write_lock" in conn.info or not is_write_statement(statement):
+            return
+        conn.info["async_write_lock"] = await_only(self._acquire())
+
+    def _on_reset(self, dbapi_connection, connection_record, reset_state):
+        self._release(connection_record.info)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        if connection_record is not None:
+            self._release(connection_record.info)
+
+    async def _acquire(self) -> Optional[bool]:
+        """None - не дождались очереди; False - не дождались общей блокировки (пишем под busy_timeout)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio.Lock привязан к своему event loop
+            self._lock, self._loop = asyncio.Lock(), loop
+        try:
+            await asyncio.wait_for(self._lock.acquire(), self.write_lock.timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        # Свой владелец на каждую транзакцию: общий поток event loop не делает её реентерабельной
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.write_lock.acquire, object()))
+        try:
+            return await asyncio.shield(waiter)
+        except BaseException:
+            # Запрос отменён, а поток всё равно дождётся блокировки - сразу отпускаем её
+            waiter.add_done_callback(
+                lambda done: not done.cancelled() and done.result() and self.write_lock.release()
+            )
+            self._lock.release()
+            raise
+
+    def _release(self, info):
+        if "async_write_lock" not in info:
+            return
+        state = info.pop("async_write_lock")
+        if state is None:
+            return
+        if state:
+            self.write_lock.release()
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._lock.release()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._lock.release)
+
+
+def is_write_statement(statement: str) -> bool:
+    return statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def create_db_engine(
+    database_url: str,
+    production_profile: bool = True,
+    write_lock: Optional[SQLiteWriteLock] = None
+) -> Engine:
+    """
+    Engine приложения. Для SQLite в production профиле: WAL, synchronous=NORMAL,
+    busy_timeout, mmap и кэш страниц на каждом соединении, пул соединений
+    для параллельного чтения и сериализация записи через SQLiteWriteLock
+    (write_lock - общий с async engine, по умолчанию свой).
+    """
+    if "sqlite" not in database_url:
+        return create_engine(
+            database_url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+        )
+
+    if not production_profile or ":memory:" in database_url:
+        return create_engine(database_url, connect_args={"check_same_thread": False})
+
+    engine = create_engine(
+        database_url,
+        connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT / 1000},
+        pool_size=settings.SQLITE_POOL_SIZE,
+        max_overflow=settings.SQLITE_POOL_SIZE,
+    )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    (write_lock or SQLiteWriteLock(timeout=settings.SQLITE_BUSY_TIMEOUT / 1000)).install(engine)
+    return engine
+
+
+def to_async_url(database_url: str) -> str:
+    """sqlite:///... -> sqlite+aiosqlite:///..., postgres(ql)://... -> postgresql+asyncpg://..."""
+    scheme, _, rest = database_url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect in ("postgres", "postgresql"):
+        return f"postgresql+asyncpg://{rest}"
+    return database_url
+
+
+def create_async_db_engine(
+    database_url: str,
+    production_profile: bool = True,
+    write_lock: Optional[SQLiteWriteLock] = None
+) -> AsyncEngine:
+    """
+    Async engine для API (aiosqlite / asyncpg по DATABASE_URL), запросы не блокируют event loop.
+    Для SQLite в production профиле запись идёт через AsyncSQLiteWriteLock поверх
+    write_lock: передайте тот же экземпляр, что и sync engine, - тогда API и воркеры
+    пишут в одну очередь. Без write_lock async писатели сериализуются только между собой.
+    """
+    async_url = to_async_url(database_url)
+    if "sqlite" not in async_url:
+        return create_async_engine(
+            async_url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+        )
+
+    if not production_profile or ":memory:" in async_url:
+        return create_async_engine(async_url)
+
+    engine = create_async_engine(
+        async_url,
+        connect_args={"timeout": settings.SQLITE_BUSY_TIMEOUT / 1000},
+        pool_size=settings.SQLITE_POOL_SIZE,
+        max_overflow=settings.SQLITE_POOL_SIZE,
+    )
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    AsyncSQLiteWriteLock(write_lock or SQLiteWriteLock(timeout=settings.SQLITE_BUSY_TIMEOUT / 1000)).install(engine)
+    return engine
+
+
+# Одна очередь записи в SQLite на процесс: воркеры (sync engine) и API (async engine)
+write_lock = SQLiteWriteLock(timeout=settings.SQLITE_BUSY_TIMEOUT / 1000)
+
+# Sync engine - фоновые воркеры, сервисы и миграции
+engine = create_db_engine(settings.DATABASE_URL, settings.SQLITE_PRODUCTION_PROFILE, write_lock)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine - роутеры API
+async_engine = create_async_db_engine(settings.DATABASE_URL, settings.SQLITE_PRODUCTION_PROFILE, write_lock)
+
+# expire_on_commit=False: после commit атрибуты не перезагружаются лениво (в async это ошибка)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
 Base = declarative_base()
 
 
@@ -22,3 +273,6 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+
+class BoundedExecutor:
+    """
+    Пул потоков для блокирующих вызовов (yt-dlp, OpenAI) из async endpoints.
+    Очередь ограничена: если все воркеры заняты и очередь полна, запрос
+    сразу получает 503, а не висит и не блокирует event loop.
+    """
+
+    def __init__(self, name: str, max_workers: int, queue_size: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server is busy ({self.name}), please retry later",
+                headers={"Retry-After": "5"},
+            )
+
+        return await asyncio.wrap_future(self._submit(functools.partial(fn, *args, **kwargs)))
+
+    def try_submit(self, fn: Callable, *args, **kwargs) -> Optional[Future]:
+        """
+        Постановка из синхронного кода (фоновые потоки, воркеры очереди) без ожидания.
+        None - пул и очередь заняты, задача отброшена.
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        return self._submit(functools.partial(fn, *args, **kwargs))
+
+    def _submit(self, fn: Callable) -> Future:
+        """Слот уже взят вызывающим"""
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._call, fn)
+        except BaseException:
+            self._release()
+            raise
+        # Слот освобождается, когда поток реально закончил работу,
+        # даже если клиент отключился и await был отменён
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _call(self, fn: Callable) -> Any:
+        with self._lock:
+            self._active += 1
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._pending - self._active,
+                "queue_size": self.queue_size,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Singleton instances
+extraction_executor = BoundedExecutor(
+    "extraction", settings.EXTRACTION_WORKERS, settings.EXTRACTION_QUEUE_SIZE
+)
+ai_executor = BoundedExecutor(
+    "ai", settings.AI_WORKERS, settings.AI_QUEUE_SIZE
+)
@@ -0,0 +1,90 @@
+import json
+
+from sqlalchemy import inspect, literal, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import MetaData
+
+from app.models.discussion_message import DiscussionMessage
+from app.models.note import Note
+
+
+def upgrade_schema(engine: Engine, metadata: MetaData):
+    """
+    Добавление недостающих колонок и индексов в уже существующие таблицы.
+    create_all создаёт только новые таблицы, а БД в продакшене живёт долго.
+    Новые колонки моделей должны быть nullable или иметь скалярный default.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if column.default is not None and column.default.is_scalar:
+                    default = literal(column.default.arg, column.type).compile(
+                        dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+                    )
+                    ddl += f' DEFAULT {default}'
+                print(f"[Migrations] {ddl}")
+                conn.execute(text(ddl))
+
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    print(f"[Migrations] CREATE INDEX {index.name}")
+                    index.create(conn)
+
+
+def migrate_note_discussions(engine: Engine, batch_size: int = 200):
+    """
+    Перенос истории обсуждений из JSON в Note.ai_discussion в таблицу
+    discussion_messages. Перенесённый JSON очищается, поэтому повторный запуск
+    ничего не делает. Битый JSON остаётся на месте для ручного разбора.
+    """
+    notes = Note.__table__
+    messages = DiscussionMessage.__table__
+    last_id = 0
+    migrated = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(notes.c.id, notes.c.ai_discussion, notes.c.updated_at)
+                .where(notes.c.id > last_id, notes.c.ai_discussion.isnot(None))
+                .order_by(notes.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                try:
+                    history = json.loads(row.ai_discussion) if row.ai_discussion.strip() else []
+                    values = [
+                        {
+                            "note_id": row.id,
+                            "role": message["role"],
+                            "content": message["content"],
+                            "created_at": row.updated_at,
+                        }
+                        for message in history
+                    ]
+                except (ValueError, TypeError, KeyError) as e:
+                    print(f"[Migrations] Заметка {row.id}: не удалось разобрать ai_discussion: {e}")
+                    continue
+                if values:
+                    conn.execute(messages.insert(), values)
+                conn.execute(
+                    notes.update().where(notes.c.id == row.id)
+                    .values(ai_discussion=None, updated_at=notes.c.updated_at)
+                )
+                migrated += 1
+
+    if migrated:
+        print(f"[Migrations] Обсуждения перенесены в discussion_messages: {migrated} заметок")
@@ -0,0 +1,100 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import literal, tuple_
+from sqlalchemy.sql import ColumnElement, Select
+
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class SortKey:
+    """Ключ сортировки списка: выражение для ORDER BY и его значение в строке результата"""
+    column: ColumnElement
+    value: Callable[[Any], Any]
+    parse: Callable[[Any], Any] = lambda value: value
+
+
+def datetime_key(column: ColumnElement, attribute: str) -> SortKey:
+    return SortKey(column, lambda row: getattr(row, attribute), datetime.fromisoformat)
+
+
+def parse_sort(sort: str, keys: Dict[str, SortKey]) -> Tuple[str, bool]:
+    """'title' / '-title' -> ('title', descending)"""
+    name = sort.lstrip('-')
+    if name not in keys:
+        raise InvalidCursor(f"Unknown sort key. Available: {', '.join(keys)}")
+    return name, sort.startswith('-')
+
+
+def encode_cursor(sort: str, value: Any, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str, key: SortKey) -> Tuple[Any, int]:
+    """Курсор привязан к сортировке: с другой sort он не имеет смысла"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+        if value is not None:
+            value = key.parse(value)
+        row_id = int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if cursor_sort != sort:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    return value, row_id
+
+
+def keyset_query(
+    query: Select,
+    id_column: ColumnElement,
+    sort: str,
+    keys: Dict[str, SortKey],
+    cursor: Optional[str],
+    limit: Optional[int],
+) -> Select:
+    """
+    Страница после cursor: WHERE (key, id) > (:value, :id) ORDER BY key, id LIMIT limit+1.
+    Лишняя строка только показывает, что есть следующая страница. Стоимость
+    не зависит от глубины страницы, в отличие от OFFSET. limit=None - все строки после cursor.
+    """
+    name, descending = parse_sort(sort, keys)
+    key = keys[name]
+
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort, key)
+        if key.column is id_column:
+            boundary, after = id_column, literal(row_id, id_column.type)
+        else:
+            boundary = tuple_(key.column, id_column)
+            after = tuple_(literal(value, key.column.type), literal(row_id, id_column.type))
+        query = query.where(boundary < after if descending else boundary > after)
+
+    if key.column is id_column:
+        order = [id_column.desc() if descending else id_column]
+    elif descending:
+        order = [key.column.desc(), id_column.desc()]
+    else:
+        order = [key.column, id_column]
+    query = query.order_by(*order)
+    return query.limit(limit + 1) if limit is not None else query
+
+
+def split_page(rows: List[Any], sort: str, keys: Dict[str, SortKey], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Результат keyset_query -> (строки страницы, курсор следующей страницы или None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(sort, keys[parse_sort(sort, keys)[0]].value(last), last.id)
@@ -0,0 +1,15 @@
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Scope
+
+from app.services.storage_manager import storage_manager
+
+
+class TrackedStaticFiles(StaticFiles):
+    """StaticFiles для /audio, отмечающий время доступа к книге (для LRU вытеснения)"""
+
+    async def get_response(self, path: str, scope: Scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 206):
+            await run_in_threadpool(storage_manager.touch_path, path)
+        return response
@@ -1,15 +1,27 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
+import threading
 
-from app.api import channels, playlists, audiobooks, notes, ai_chat, stream
+from app.api import channels, playlists, audiobooks, notes, ai_chat, stream, storage, audio, search
 from app.core.config import settings
-from app.core.database import engine
+from app.core.database import engine, async_engine
+from app.core.executors import extraction_executor, ai_executor
+from app.core.migrations import upgrade_schema, migrate_note_discussions
+from app.core.static_files import TrackedStaticFiles
 from app.models import Base
+from app.services import stream_proxy
+from app.services.youtube_service import youtube_service
+from app.services.download_queue import download_queue
+from app.services.search_service import search_service
+from app.services.storage_manager import storage_manager
+from app.services.storage_reconciler import storage_reconciler
 
 # Создание таблиц
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine, Base.metadata)
+migrate_note_discussions(engine)
+search_service.install(engine)
 
 app = FastAPI(
     title="AudioBook Library API",
@@ -24,11 +36,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount static files (audio storage)
 if os.path.exists(settings.AUDIO_STORAGE_PATH):
-    app.mount("/audio", StaticFiles(directory=settings.AUDIO_STORAGE_PATH), name="audio")
+    app.mount("/audio", TrackedStaticFiles(directory=settings.AUDIO_STORAGE_PATH), name="audio")
 
 # API Routes
 app.include_router(channels.router, prefix="/api/channels", tags=["Channels"])
@@ -37,6 +50,27 @@ app.include_router(audiobooks.router, prefix="/api/audiobooks", tags=["Audiobook
 app.include_router(notes.router, prefix="/api/notes", tags=["Notes"])
 app.include_router(ai_chat.router, prefix="/api/ai", tags=["AI"])
 app.include_router(stream.router, prefix="/api", tags=["Stream"])
+app.include_router(storage.router, prefix="/api/storage", tags=["Storage"])
+app.include_router(audio.router, prefix="/api", tags=["Audio"])
+app.include_router(search.router, prefix="/api/search", tags=["Search"])
+
+@app.on_event("startup")
+async def startup():
+    # Прогрев пула YoutubeDL (экстракторы, cookies) в фоне, не задерживая старт
+    threading.Thread(target=youtube_service.ydl_pool.warm, daemon=True).start()
+    download_queue.start()
+    storage_reconciler.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    download_queue.stop()
+    storage_reconciler.stop()
+    storage_manager.flush()
+    await async_engine.dispose()
+    await stream_proxy.close_client()
+    extraction_executor.shutdown()
+    ai_executor.shutdown()
+    youtube_service.ydl_pool.close()
 
 @app.get("/")
 async def root():
@@ -58,6 +92,10 @@ async def api_health():
         "service": "audiobook-api",
         "version": "1.0.1",
         "deployed_at": datetime.datetime.now().isoformat(),
-        "build": "railway-auto-deploy"
+        "build": "railway-auto-deploy",
+        "executors": {
+            "extraction": extraction_executor.stats(),
+            "ai": ai_executor.stats(),
+        }
     }
 
@@ -3,7 +3,10 @@ from app.models.channel import Channel
 from app.models.playlist import Playlist
 from app.models.audiobook import Audiobook
 from app.models.note import Note
+from app.models.download_job import DownloadJob
+from app.models.audio_rendition import AudioRendition
+from app.models.discussion_message import DiscussionMessage
 
-__all__ = ["Base", "Channel", "Playlist", "Audiobook", "Note"]
+__all__ = ["Base", "Channel", "Playlist", "Audiobook", "Note", "DownloadJob", "AudioRendition", "DiscussionMessage"]
 
 
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class AudioRendition(Base):
+    __tablename__ = "audio_renditions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    audiobook_id = Column(Integer, ForeignKey("audiobooks.id"), nullable=False, index=True)
+    name = Column(String, nullable=False)  # Пресет: speech-32, speech-48...
+    codec = Column(String, nullable=False)
+    bitrate = Column(Integer, nullable=False)  # kbps
+    channels = Column(Integer, nullable=False)
+    
+    audio_file_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=True)  # в байтах
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    audiobook = relationship("Audiobook", back_populates="renditions")
+
+    __table_args__ = (
+        UniqueConstraint("audiobook_id", "name", name="uq_audio_renditions_audiobook_name"),
+    )
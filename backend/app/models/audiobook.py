@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -19,12 +19,20 @@ class Audiobook(Base):
     audio_file_path = Column(String, nullable=True)
     duration = Column(Float, nullable=True)  # в секундах
     file_size = Column(Integer, nullable=True)  # в байтах
+    audio_format = Column(String, nullable=True)  # mp3 / m4a / opus / webm
+    hls_playlist_path = Column(String, nullable=True)  # /audio/.../<file>.hls/index.m3u8
+    hls_size = Column(Integer, nullable=True)  # в байтах, все сегменты
     
     # Status
     is_downloaded = Column(Boolean, default=False)
     is_converted = Column(Boolean, default=False)
     download_progress = Column(Float, default=0.0)  # 0-100%
     
+    # Storage (LRU вытеснение при превышении STORAGE_QUOTA_BYTES)
+    is_pinned = Column(Boolean, default=False)  # закреплённые книги не вытесняются
+    last_accessed_at = Column(DateTime, nullable=True, index=True)
+    play_count = Column(Integer, default=0)  # начатые прослушивания файла
+    
     # Video info
     video_url = Column(String, nullable=False)
     upload_date = Column(DateTime, nullable=True)
@@ -37,5 +45,13 @@ class Audiobook(Base):
     # Relationships
     playlist = relationship("Playlist", back_populates="audiobooks")
     notes = relationship("Note", back_populates="audiobook", cascade="all, delete-orphan")
+    download_jobs = relationship("DownloadJob", back_populates="audiobook", cascade="all, delete-orphan")
+    renditions = relationship("AudioRendition", back_populates="audiobook", cascade="all, delete-orphan")
+
+    # Keyset пагинация списков: книги плейлиста по id, скачанные по времени изменения
+    __table_args__ = (
+        Index("ix_audiobooks_playlist_id_id", "playlist_id", "id"),
+        Index("ix_audiobooks_is_downloaded_updated_at", "is_downloaded", "updated_at"),
+    )
 
 
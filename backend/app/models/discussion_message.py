@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class DiscussionMessage(Base):
+    __tablename__ = "discussion_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey("notes.id"), nullable=False)
+    role = Column(String, nullable=False)  # user / assistant
+    content = Column(Text, nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    note = relationship("Note", back_populates="discussion_messages")
+
+    # История заметки читается страницами с конца: note_id = ? AND id < ? ORDER BY id DESC
+    __table_args__ = (
+        Index("ix_discussion_messages_note_id_id", "note_id", "id"),
+    )
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, Boolean
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class DownloadJob(Base):
+    __tablename__ = "download_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    audiobook_id = Column(Integer, ForeignKey("audiobooks.id"), nullable=False, index=True)
+    
+    # Status: queued / running / done / failed
+    status = Column(String, nullable=False, default="queued")
+    priority = Column(Integer, nullable=False, default=0)  # больше - раньше
+    profile = Column(String, nullable=True)  # профиль хранения аудио, None - из настроек
+    renditions = Column(String, nullable=True)  # дополнительные renditions через запятую
+    hls = Column(Boolean, nullable=True)  # HLS упаковка, None - из настроек
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    next_run_at = Column(DateTime, default=datetime.utcnow)  # для backoff между попытками
+    last_error = Column(Text, nullable=True)
+    
+    # Владелец running задачи (host:pid) и его последняя отметка о том, что он жив
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    audiobook = relationship("Audiobook", back_populates="download_jobs")
+
+    __table_args__ = (
+        Index("ix_download_jobs_status_priority", "status", "priority", "next_run_at"),
+    )
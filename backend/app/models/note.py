@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Float, func, select
+from sqlalchemy.orm import column_property, relationship
 from datetime import datetime
 
 from app.core.database import Base
+from app.models.discussion_message import DiscussionMessage
 
 
 class Note(Base):
@@ -13,8 +14,9 @@ class Note(Base):
     quote = Column(Text, nullable=True)  # Цитата из аудиокниги
     timestamp = Column(Float, nullable=True)  # Временная метка в аудио (секунды)
     
-    # AI conversation
-    ai_discussion = Column(Text, nullable=True)  # JSON с историей обсуждения
+    # AI conversation: сообщения в discussion_messages, здесь только
+    # устаревший JSON, который переносится в таблицу при старте (migrate_note_discussions)
+    ai_discussion = Column(Text, nullable=True)
     
     audiobook_id = Column(Integer, ForeignKey("audiobooks.id"), nullable=False)
     
@@ -23,5 +25,14 @@ class Note(Base):
     
     # Relationships
     audiobook = relationship("Audiobook", back_populates="notes")
-
-
+    discussion_messages = relationship(
+        "DiscussionMessage", back_populates="note", cascade="all, delete-orphan",
+        order_by=DiscussionMessage.id
+    )
+    
+    discussion_count = column_property(
+        select(func.count(DiscussionMessage.id))
+        .where(DiscussionMessage.note_id == id)
+        .correlate_except(DiscussionMessage)
+        .scalar_subquery()
+    )
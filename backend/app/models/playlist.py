@@ -18,6 +18,12 @@ class Playlist(Base):
     
     channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
     
+    # Incremental sync
+    last_seen_ids = Column(Text, nullable=True)  # JSON с id первых видео при последнем sync
+    sync_fingerprint = Column(String, nullable=True)  # хэш метаданных плейлиста
+    synced_count = Column(Integer, nullable=True)  # видео в плейлисте по данным последнего sync
+    last_synced_at = Column(DateTime, nullable=True)
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -0,0 +1,55 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from app.core.config import settings
+
+
+class BandwidthBudget:
+    """
+    Общий лимит скорости скачивания на все загрузки.
+    Лимит делится поровну между активными загрузками через params['ratelimit']
+    экземпляров YoutubeDL: yt-dlp читает его на каждом чанке, поэтому
+    при старте/завершении загрузки доли остальных пересчитываются на лету.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit  # байт/с, 0 - без лимита
+        self._active: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def share(self, ydl_params: Dict) -> Iterator[None]:
+        if not self.limit:
+            yield
+            return
+
+        with self._lock:
+            self._active.append(ydl_params)
+            self._rebalance()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.remove(ydl_params)
+                self._rebalance()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = len(self._active)
+        return {
+            "limit": self.limit or None,
+            "active": active,
+            "per_download": self.limit // active if self.limit and active else None,
+        }
+
+    def _rebalance(self):
+        if not self._active:
+            return
+        per_download = max(self.limit // len(self._active), 1)
+        for params in self._active:
+            params['ratelimit'] = per_download
+
+
+# Singleton instance
+bandwidth_budget = BandwidthBudget(limit=settings.DOWNLOAD_BANDWIDTH_LIMIT)
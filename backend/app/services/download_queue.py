@@ -0,0 +1,471 @@
+import os
+import queue
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.audiobook import Audiobook
+from app.models.download_job import DownloadJob
+from app.services.bandwidth import bandwidth_budget
+from app.services.download_service import (
+    DownloadInProgress, FetchedAudio, fetch_stage, transcode_stage, parse_renditions
+)
+from app.services.progress_tracker import progress_tracker
+from app.services.storage_manager import storage_manager
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class DownloadQueue:
+    """
+    Персистентная очередь загрузок в таблице download_jobs.
+
+    Задача проходит две стадии в независимых пулах потоков:
+    DOWNLOAD_WORKERS (сеть) забирают задачи по приоритету и скачивают
+    исходный поток, TRANSCODE_WORKERS (CPU, ffmpeg) конвертируют его.
+    Между стадиями ограниченная очередь: если конвертация не успевает,
+    скачивающие воркеры ждут и не берут новые задачи. Каждая стадия
+    выполняется в собственной сессии БД. Неудачные попытки повторяются
+    с экспоненциальным backoff. Процесс-владелец running задачи
+    (worker_id) отмечает её heartbeat_at; задачи, чей владелец перестал
+    отмечаться (упал или перезапущен), возвращаются в очередь - при старте
+    и периодически, не трогая задачи других живых процессов (uvicorn workers).
+    """
+
+    def __init__(self, workers: int, poll_interval: float, transcode_workers: int, transcode_queue_size: int):
+        self.workers = workers
+        self.transcode_workers = transcode_workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._transcode_queue: queue.Queue = queue.Queue(maxsize=transcode_queue_size)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self.recover()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"download-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        for i in range(self.transcode_workers):
+            thread = threading.Thread(target=self._transcode_worker, name=f"transcode-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self._threads:
+            thread = threading.Thread(target=self._heartbeat_worker, name="download-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[Download Queue] Запущено воркеров: {self.workers} скачивание, "
+              f"{self.transcode_workers} конвертация")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        if self._threads:
+            self._requeue_owned()
+        self._threads = []
+
+    def enqueue(
+        self,
+        db: Session,
+        audiobook_id: int,
+        priority: int = 0,
+        profile: Optional[str] = None,
+        renditions: Optional[List[str]] = None,
+        hls: Optional[bool] = None
+    ) -> DownloadJob:
+        """
+        Постановка аудиокниги в очередь. Если для неё уже есть активная задача,
+        возвращается она (с повышенным приоритетом, если новый выше).
+        """
+        job = db.query(DownloadJob).filter(
+            DownloadJob.audiobook_id == audiobook_id,
+            DownloadJob.status.in_(ACTIVE_STATUSES)
+        ).first()
+
+        if job:
+            if priority > job.priority:
+                job.priority = priority
+        else:
+            job = DownloadJob(
+                audiobook_id=audiobook_id,
+                priority=priority,
+                profile=profile,
+                renditions=",".join(renditions) if renditions is not None else None,
+                hls=hls,
+                max_attempts=settings.DOWNLOAD_MAX_ATTEMPTS,
+            )
+            db.add(job)
+
+        db.commit()
+        db.refresh(job)
+        if job.status == "queued":
+            # download_progress уже в этой транзакции (эндпоинт), отдельный commit не нужен
+            progress_tracker.update(audiobook_id, persist=False, status="queued", progress=1.0, error=None)
+        self._wake.set()
+        return job
+
+    def enqueue_many(
+        self,
+        db: Session,
+        audiobook_ids: List[int],
+        priority: int = 0,
+        profile: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Массовая постановка в очередь (плейлист/канал целиком) одним commit.
+        Одновременность ограничивается пулом воркеров, а не количеством задач.
+        """
+        active = {
+            audiobook_id
+            for (audiobook_id,) in db.query(DownloadJob.audiobook_id).filter(
+                DownloadJob.audiobook_id.in_(audiobook_ids),
+                DownloadJob.status.in_(ACTIVE_STATUSES)
+            )
+        } if audiobook_ids else set()
+
+        new_ids = [audiobook_id for audiobook_id in audiobook_ids if audiobook_id not in active]
+        db.add_all([
+            DownloadJob(
+                audiobook_id=audiobook_id,
+                priority=priority,
+                profile=profile,
+                max_attempts=settings.DOWNLOAD_MAX_ATTEMPTS,
+            )
+            for audiobook_id in new_ids
+        ])
+        if new_ids:
+            db.query(Audiobook).filter(Audiobook.id.in_(new_ids)).update(
+                {Audiobook.download_progress: 1.0}, synchronize_session=False
+            )
+        db.commit()
+
+        # download_progress записан массовым UPDATE выше - здесь только память и SSE
+        for audiobook_id in new_ids:
+            progress_tracker.update(audiobook_id, persist=False, status="queued", progress=1.0, error=None)
+        self._wake.set()
+        return {"queued": len(new_ids), "already_queued": len(active)}
+
+    def aggregate_progress(self, db: Session, audiobook_ids: List[int]) -> Dict:
+        """
+        Сводный прогресс группы аудиокниг (плейлист/канал): счётчики по статусам,
+        общий процент, суммарная скорость и ETA. Размер ещё не начатых загрузок
+        оценивается по среднему размеру уже известных.
+        """
+        books = db.query(Audiobook.id, Audiobook.is_downloaded, Audiobook.file_size).filter(
+            Audiobook.id.in_(audiobook_ids)
+        ).all() if audiobook_ids else []
+
+        # Статус последней задачи каждой книги
+        job_status = dict(
+            db.query(DownloadJob.audiobook_id, DownloadJob.status)
+            .filter(DownloadJob.audiobook_id.in_([book.id for book in books]))
+            .order_by(DownloadJob.id)
+            .all()
+        ) if books else {}
+
+        counts = {"total": len(books), "downloaded": 0, "queued": 0, "running": 0, "failed": 0}
+        done_units = 0.0
+        speed = 0.0
+        remaining_bytes = 0
+        unknown_size = 0
+        known_sizes = [book.file_size for book in books if book.is_downloaded and book.file_size]
+
+        for book in books:
+            if book.is_downloaded:
+                counts["downloaded"] += 1
+                done_units += 1
+                continue
+            status = job_status.get(book.id)
+            if status not in ("queued", "running", "failed"):
+                continue
+            counts[status] += 1
+            if status == "failed":
+                continue
+
+            state = progress_tracker.get(book.id) or {}
+            done_units += (state.get("progress") or 0) / 100
+            speed += state.get("speed") or 0
+            total_bytes = state.get("total_bytes")
+            if total_bytes:
+                known_sizes.append(total_bytes)
+                remaining_bytes += max(total_bytes - (state.get("downloaded_bytes") or 0), 0)
+            else:
+                unknown_size += 1
+
+        if unknown_size and known_sizes:
+            remaining_bytes += unknown_size * sum(known_sizes) // len(known_sizes)
+
+        pending = counts["queued"] + counts["running"]
+        return {
+            **counts,
+            "progress": round(done_units / len(books) * 100, 1) if books else 0.0,
+            "speed": speed or None,
+            "remaining_bytes": remaining_bytes if pending else 0,
+            "eta": int(remaining_bytes / speed) if pending and speed else None,
+        }
+
+    def recover(self):
+        """
+        Возврат в очередь running задач умерших владельцев: heartbeat_at старше
+        DOWNLOAD_HEARTBEAT_TIMEOUT (или задача взята до появления heartbeat).
+        Задачи живых процессов не трогаются.
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.DOWNLOAD_HEARTBEAT_TIMEOUT)
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(DownloadJob)
+                .where(
+                    DownloadJob.status == "running",
+                    or_(DownloadJob.heartbeat_at.is_(None), DownloadJob.heartbeat_at < stale)
+                )
+                .values(status="queued", next_run_at=now, worker_id=None)
+            )
+            db.commit()
+            if result.rowcount:
+                print(f"[Download Queue] Возвращено в очередь задач без владельца: {result.rowcount}")
+        finally:
+            db.close()
+
+    def _requeue_owned(self):
+        """Остановка процесса: его задачи сразу возвращаются в очередь, не дожидаясь таймаута heartbeat"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(DownloadJob)
+                .where(DownloadJob.status == "running", DownloadJob.worker_id == self.worker_id)
+                .values(status="queued", next_run_at=datetime.utcnow(), worker_id=None)
+            )
+            db.commit()
+        except Exception as e:
+            print(f"[Download Queue ERROR] Ошибка возврата задач в очередь: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def heartbeat(self):
+        """Отметка running задач этого процесса (в том числе ожидающих конвертации)"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(DownloadJob)
+                .where(DownloadJob.status == "running", DownloadJob.worker_id == self.worker_id)
+                .values(heartbeat_at=datetime.utcnow(), updated_at=DownloadJob.updated_at)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        db = SessionLocal()
+        try:
+            stats = {
+                status: db.query(DownloadJob).filter(DownloadJob.status == status).count()
+                for status in ("queued", "running", "failed")
+            }
+            stats["awaiting_transcode"] = self._transcode_queue.qsize()
+            stats["bandwidth"] = bandwidth_budget.stats()
+            return stats
+        finally:
+            db.close()
+
+    def _claim(self) -> Optional[int]:
+        """Атомарный захват следующей задачи (UPDATE ... WHERE status='queued')"""
+        db = SessionLocal()
+        try:
+            while True:
+                job_id = db.query(DownloadJob.id).filter(
+                    DownloadJob.status == "queued",
+                    DownloadJob.next_run_at <= datetime.utcnow()
+                ).order_by(
+                    DownloadJob.priority.desc(), DownloadJob.id
+                ).limit(1).scalar()
+                if job_id is None:
+                    return None
+
+                result = db.execute(
+                    update(DownloadJob)
+                    .where(DownloadJob.id == job_id, DownloadJob.status == "queued")
+                    .values(
+                        status="running",
+                        attempts=DownloadJob.attempts + 1,
+                        started_at=datetime.utcnow(),
+                        worker_id=self.worker_id,
+                        heartbeat_at=datetime.utcnow(),
+                    )
+                )
+                db.commit()
+                if result.rowcount == 1:
+                    return job_id
+                # Задачу забрал другой воркер - пробуем следующую
+        finally:
+            db.close()
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job_id = self._claim()
+            except Exception as e:
+                print(f"[Download Queue ERROR] Ошибка выбора задачи: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            fetched = self._fetch(job_id)
+            if fetched is None:
+                continue
+
+            # Backpressure: ждём места в очереди конвертации
+            while not self._stop.is_set():
+                try:
+                    self._transcode_queue.put((job_id, fetched), timeout=self.poll_interval)
+                    break
+                except queue.Full:
+                    continue
+
+    def _heartbeat_worker(self):
+        while not self._stop.wait(settings.DOWNLOAD_HEARTBEAT_INTERVAL):
+            try:
+                self.heartbeat()
+                self.recover()
+            except Exception as e:
+                print(f"[Download Queue ERROR] Ошибка heartbeat: {e}")
+            else:
+                self._wake.set()
+
+    def _transcode_worker(self):
+        while not self._stop.is_set():
+            try:
+                job_id, fetched = self._transcode_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            try:
+                self._transcode(job_id, fetched)
+            finally:
+                self._transcode_queue.task_done()
+
+    def _fetch(self, job_id: int) -> Optional[FetchedAudio]:
+        """Стадия скачивания. None - задача завершена здесь (ошибка или нет аудиокниги)"""
+        db = SessionLocal()
+        try:
+            job = db.query(DownloadJob).filter(DownloadJob.id == job_id).first()
+            if not job:
+                return None
+            audiobook_id = job.audiobook_id
+            print(f"[Download Queue] Задача {job_id}: аудиокнига {audiobook_id}, попытка {job.attempts}")
+
+            try:
+                fetched = fetch_stage(audiobook_id, db, job.profile)
+            except DownloadInProgress as e:
+                self._defer(db, job_id, e)
+                return None
+            except Exception as e:
+                self._fail(db, job_id, audiobook_id, e)
+                return None
+
+            if fetched is None:
+                self._complete(db, job_id)
+            return fetched
+        except Exception as e:
+            print(f"[Download Queue ERROR] Задача {job_id}: {e}")
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def _transcode(self, job_id: int, fetched: FetchedAudio):
+        """Стадия конвертации"""
+        db = SessionLocal()
+        try:
+            job = db.query(DownloadJob).filter(DownloadJob.id == job_id).first()
+            if not job:
+                return
+            renditions = parse_renditions(job.renditions) if job.renditions is not None else None
+
+            try:
+                transcode_stage(fetched, db, job.profile, renditions, job.hls)
+            except Exception as e:
+                self._fail(db, job_id, fetched.audiobook_id, e)
+                return
+
+            self._complete(db, job_id)
+
+            # Новый файл мог превысить квоту хранилища
+            try:
+                storage_manager.enforce_quota(db, exclude=fetched.audiobook_id)
+            except Exception as e:
+                print(f"[Download Queue ERROR] Ошибка вытеснения: {e}")
+                db.rollback()
+        except Exception as e:
+            print(f"[Download Queue ERROR] Задача {job_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _complete(self, db: Session, job_id: int):
+        job = db.query(DownloadJob).filter(DownloadJob.id == job_id).first()
+        if job:
+            job.status = "done"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+
+    def _defer(self, db: Session, job_id: int, error: Exception):
+        """Аудиокнигу обрабатывает другой воркер/процесс: повтор позже без траты попытки"""
+        db.rollback()
+        job = db.query(DownloadJob).filter(DownloadJob.id == job_id).first()
+        if not job:
+            return
+        job.status = "queued"
+        job.attempts = max(job.attempts - 1, 0)
+        job.next_run_at = datetime.utcnow() + timedelta(seconds=settings.DOWNLOAD_RETRY_BACKOFF)
+        db.commit()
+        print(f"[Download Queue] Задача {job_id} отложена: {error}")
+
+    def _fail(self, db: Session, job_id: int, audiobook_id: int, error: Exception):
+        """Повтор с backoff или окончательная ошибка задачи"""
+        db.rollback()
+        job = db.query(DownloadJob).filter(DownloadJob.id == job_id).first()
+        if not job:
+            return
+        job.last_error = str(error)[:2000]
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+            progress_tracker.finish(audiobook_id, "failed", job.last_error)
+            print(f"[Download Queue ERROR] Задача {job_id} провалена: {error}")
+        else:
+            delay = min(
+                settings.DOWNLOAD_RETRY_BACKOFF * 2 ** (job.attempts - 1),
+                settings.DOWNLOAD_RETRY_BACKOFF_MAX
+            )
+            job.status = "queued"
+            job.next_run_at = datetime.utcnow() + timedelta(seconds=delay)
+            progress_tracker.update(audiobook_id, status="queued", error=job.last_error)
+            print(f"[Download Queue] Задача {job_id}: повтор через {delay} с ({error})")
+        db.commit()
+
+
+# Singleton instance
+download_queue = DownloadQueue(
+    workers=settings.DOWNLOAD_WORKERS,
+    poll_interval=settings.DOWNLOAD_QUEUE_POLL_INTERVAL,
+    transcode_workers=settings.TRANSCODE_WORKERS,
+    transcode_queue_size=settings.TRANSCODE_QUEUE_SIZE,
+)
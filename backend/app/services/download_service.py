@@ -0,0 +1,325 @@
+import os
+import shutil
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.executors import ai_executor
+from app.models.audiobook import Audiobook
+from app.models.audio_rendition import AudioRendition
+from app.services.ai_service import ai_service
+from app.services.file_lock import FileLock, audiobook_lock
+from app.services.media_service import media_service, RENDITION_PRESETS
+from app.services.progress_tracker import progress_tracker
+from app.services.youtube_service import youtube_service, AUDIO_PROFILES
+
+
+class DownloadInProgress(Exception):
+    """Аудиокнигу уже обрабатывает другой поток или процесс"""
+
+
+@dataclass
+class FetchedAudio:
+    """Результат стадии скачивания, передаётся в стадию конвертации"""
+    audiobook_id: int
+    output_path: str  # путь без расширения
+    source_path: Optional[str]  # None - книга уже скачана, нужны только renditions / HLS
+    duration: Optional[float] = None
+    lock: Optional[FileLock] = None  # держится до конца стадии конвертации
+
+    def release(self):
+        if self.lock:
+            self.lock.release()
+            self.lock = None
+
+
+def to_audio_url(file_path: str) -> str:
+    """
+    Конвертируем абсолютный путь в URL для API
+    Из: /full/path/storage/audio/playlist_X/file.mp3
+    В: /audio/playlist_X/file.mp3
+    """
+    if settings.AUDIO_STORAGE_PATH in file_path:
+        # Получаем относительный путь от storage/audio
+        relative_path = file_path.replace(settings.AUDIO_STORAGE_PATH, '').lstrip('/')
+        return f"/audio/{relative_path}"
+    return file_path
+
+
+def from_audio_url(audio_url: str) -> str:
+    """Обратное преобразование: /audio/playlist_X/file.mp3 -> путь на диске"""
+    if audio_url.startswith('/audio/'):
+        return os.path.join(settings.AUDIO_STORAGE_PATH, audio_url[len('/audio/'):])
+    return audio_url
+
+
+def parse_renditions(value: Optional[str]) -> List[str]:
+    """'speech-32, speech-48' -> ['speech-32', 'speech-48'] (только известные пресеты)"""
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    return [name for name in names if name in RENDITION_PRESETS]
+
+
+def build_renditions(db: Session, audiobook: Audiobook, source_path: str, output_path: str, names: List[str]):
+    """Создание недостающих renditions из скачанного файла. Ошибка одного не мешает остальным."""
+    existing = {r.name for r in audiobook.renditions}
+    for name in names:
+        if name in existing:
+            continue
+        preset = RENDITION_PRESETS[name]
+        rendition_path = f"{output_path}.{name}.{preset['ext']}"
+        try:
+            media_service.transcode_rendition(source_path, rendition_path, name)
+            db.add(AudioRendition(
+                audiobook_id=audiobook.id,
+                name=name,
+                codec=preset['codec'],
+                bitrate=preset['bitrate'],
+                channels=preset['channels'],
+                audio_file_path=to_audio_url(rendition_path),
+                file_size=os.path.getsize(rendition_path),
+            ))
+            db.commit()
+        except Exception as e:
+            print(f"Error building rendition {name} for {audiobook.id}: {e}")
+            db.rollback()
+
+
+def generate_summary(audiobook_id: int):
+    """AI описание скачанной книги в отдельной сессии (выполняется в ai_executor)"""
+    db = SessionLocal()
+    try:
+        audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+        if not audiobook or audiobook.ai_summary:
+            return
+        try:
+            summary = ai_service.generate_book_summary(
+                audiobook.title,
+                audiobook.description or ""
+            )
+            if summary:
+                audiobook.ai_summary = summary
+            elif audiobook.description:
+                # Fallback к описанию с YouTube, если AI не сработал
+                # Берем первые 200 символов и обрезаем до ближайшего пробела
+                desc_preview = audiobook.description[:200]
+                if len(audiobook.description) > 200:
+                    last_space = desc_preview.rfind(' ')
+                    if last_space > 0:
+                        desc_preview = desc_preview[:last_space] + "..."
+                audiobook.ai_summary = desc_preview
+        except Exception as ai_error:
+            print(f"Error generating summary for {audiobook_id}: {ai_error}")
+            # Fallback при ошибке
+            if audiobook.description:
+                audiobook.ai_summary = audiobook.description[:150] + "..."
+        db.commit()
+    except Exception as e:
+        print(f"Error saving summary for {audiobook_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def build_hls(db: Session, audiobook: Audiobook, source_path: str, output_path: str):
+    """HLS упаковка скачанного файла. Ошибка не отменяет основную загрузку."""
+    output_dir = f"{output_path}.hls"
+    try:
+        playlist_path = media_service.package_hls(source_path, output_dir, settings.HLS_SEGMENT_SECONDS)
+        audiobook.hls_playlist_path = to_audio_url(playlist_path)
+        audiobook.hls_size = sum(
+            entry.stat().st_size for entry in os.scandir(output_dir) if entry.is_file()
+        )
+        db.commit()
+    except Exception as e:
+        print(f"Error packaging HLS for {audiobook.id}: {e}")
+        db.rollback()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def _output_path(audiobook: Audiobook) -> str:
+    # Создаем директорию для плейлиста
+    playlist_dir = os.path.join(
+        settings.AUDIO_STORAGE_PATH,
+        f"playlist_{audiobook.playlist_id}"
+    )
+    os.makedirs(playlist_dir, exist_ok=True)
+    
+    # Безопасное имя файла
+    safe_filename = "".join(c for c in audiobook.title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    return os.path.join(playlist_dir, f"{safe_filename}_{audiobook.youtube_id}")
+
+
+def _reset_download(db: Session, audiobook_id: int, error: Exception):
+    print(f"Error downloading audiobook {audiobook_id}: {error}")
+    db.rollback()
+    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    if audiobook:
+        audiobook.download_progress = 0.0
+        audiobook.is_downloaded = False
+        db.commit()
+
+
+def fetch_stage(audiobook_id: int, db: Session, profile: Optional[str] = None) -> Optional[FetchedAudio]:
+    """
+    Стадия 1 (I/O): скачивание исходного аудиопотока без конвертации.
+    Берёт блокировку аудиокниги (DownloadInProgress, если занята), которая
+    передаётся в стадию конвертации. Прерванная загрузка (.part) докачивается.
+    Возвращает None, если аудиокнига не найдена.
+    """
+    lock = audiobook_lock(audiobook_id)
+    if not lock.acquire():
+        raise DownloadInProgress(f"Audiobook {audiobook_id} is already being downloaded")
+    
+    # Читаем состояние уже под блокировкой: другой процесс мог закончить загрузку
+    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    if not audiobook:
+        lock.release()
+        return None
+    
+    try:
+        output_path = _output_path(audiobook)
+        
+        existing_path = from_audio_url(audiobook.audio_file_path) if audiobook.audio_file_path else None
+        if audiobook.is_downloaded and existing_path and os.path.exists(existing_path):
+            print(f"Audiobook {audiobook_id} already downloaded, building renditions / HLS only")
+            return FetchedAudio(audiobook_id, output_path, None, lock=lock)
+        
+        progress_tracker.start(audiobook_id)
+        result = youtube_service.fetch_audio(
+            audiobook.video_url,
+            f"{output_path}.source",
+            progress_callback=progress_tracker.hook(audiobook_id),
+            profile=profile
+        )
+        
+        source_path = result['file_path']
+        expected_size = result.get('filesize')
+        actual_size = os.path.getsize(source_path)
+        if expected_size and actual_size != expected_size:
+            os.remove(source_path)
+            raise ValueError(f"Downloaded size mismatch: {actual_size} of {expected_size} bytes")
+        
+        return FetchedAudio(audiobook_id, output_path, source_path, result.get('duration'), lock=lock)
+    except Exception as e:
+        lock.release()
+        _reset_download(db, audiobook_id, e)
+        raise
+
+
+def transcode_stage(
+    fetched: FetchedAudio,
+    db: Session,
+    profile: Optional[str] = None,
+    renditions: Optional[List[str]] = None,
+    hls: Optional[bool] = None
+):
+    """
+    Стадия 2 (CPU): конвертация скачанного файла по профилю, renditions,
+    HLS упаковка (hls, по умолчанию HLS_PACKAGING); AI описание ставится в ai_executor.
+    Книга помечается скачанной только после проверки итогового файла
+    (размер, аудиодорожка, длительность). Снимает блокировку аудиокниги.
+    """
+    try:
+        _transcode(fetched, db, profile, renditions, hls)
+    finally:
+        fetched.release()
+
+
+def _transcode(
+    fetched: FetchedAudio,
+    db: Session,
+    profile: Optional[str],
+    renditions: Optional[List[str]],
+    hls: Optional[bool]
+):
+    audiobook_id = fetched.audiobook_id
+    audiobook = db.query(Audiobook).filter(Audiobook.id == audiobook_id).first()
+    if not audiobook:
+        return
+    
+    try:
+        if renditions is None:
+            renditions = parse_renditions(settings.AUDIO_RENDITIONS)
+        
+        progress_tracker.update(audiobook_id, status="converting", progress=99.0, speed=None, eta=None)
+        if fetched.source_path is None:
+            source_path = from_audio_url(audiobook.audio_file_path)
+        else:
+            audio_profile = AUDIO_PROFILES[profile or settings.AUDIO_STORAGE_PROFILE]
+            source_path = media_service.extract_audio(
+                fetched.source_path,
+                fetched.output_path,
+                codec=audio_profile['codec'],
+                quality=audio_profile['quality']
+            )
+            
+            try:
+                info = media_service.verify_audio(source_path, fetched.duration)
+            except Exception:
+                # Повреждённый файл не должен остаться под итоговым именем
+                if os.path.exists(source_path):
+                    os.remove(source_path)
+                raise
+            
+            audiobook.audio_file_path = to_audio_url(source_path)
+            audiobook.duration = fetched.duration or info['duration']
+            audiobook.audio_format = os.path.splitext(source_path)[1].lstrip('.')
+            audiobook.is_downloaded = True
+            audiobook.is_converted = True
+            audiobook.download_progress = 100.0
+            
+            if os.path.exists(source_path):
+                audiobook.file_size = os.path.getsize(source_path)
+            
+            db.commit()
+            progress_tracker.finish(audiobook_id, "done")
+        
+        try:
+            # Компактные renditions для речи (ошибки не отменяют основную загрузку)
+            build_renditions(db, audiobook, source_path, fetched.output_path, renditions)
+            
+            # Сегменты для быстрой перемотки (при повторной загрузке - только если их ещё нет)
+            if (settings.HLS_PACKAGING if hls is None else hls) and (
+                fetched.source_path is not None or not audiobook.hls_playlist_path
+            ):
+                build_hls(db, audiobook, source_path, fetched.output_path)
+        except Exception as e:
+            progress_tracker.finish(audiobook_id, "failed", str(e))
+            raise
+        
+        if fetched.source_path is None:
+            # Книга уже была скачана (задача только на renditions / HLS): иначе
+            # прогресс так и остался бы в "queued" из enqueue
+            progress_tracker.finish(audiobook_id, "done")
+        
+        # AI описание в ai_executor: медленный запрос к OpenAI не занимает слот конвертации
+        if not audiobook.ai_summary and ai_executor.try_submit(generate_summary, audiobook_id) is None:
+            print(f"[Download] Пул AI занят, описание {audiobook_id} не сгенерировано")
+        
+    except Exception as e:
+        _reset_download(db, audiobook_id, e)
+        raise
+
+
+def download_and_convert(
+    audiobook_id: int,
+    db: Session,
+    profile: Optional[str] = None,
+    renditions: Optional[List[str]] = None,
+    hls: Optional[bool] = None
+):
+    """
+    Скачивание и конвертация аудиокниги: обе стадии подряд в текущем потоке.
+    profile - профиль хранения (transcode / remux-*), по умолчанию AUDIO_STORAGE_PROFILE.
+    renditions - дополнительные renditions (по умолчанию AUDIO_RENDITIONS). Если файл
+    уже скачан, создаются только недостающие renditions и HLS.
+    hls - HLS упаковка (по умолчанию HLS_PACKAGING).
+    Очередь загрузок выполняет стадии в разных пулах (см. DownloadQueue);
+    при ошибке исключение пробрасывается, чтобы можно было повторить попытку.
+    """
+    fetched = fetch_stage(audiobook_id, db, profile)
+    if fetched:
+        transcode_stage(fetched, db, profile, renditions, hls)
@@ -0,0 +1,63 @@
+import os
+import threading
+from typing import Optional, Set
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: только блокировка внутри процесса
+    fcntl = None
+
+LOCKS_PATH = os.path.join(settings.TEMP_STORAGE_PATH, "locks")
+
+_held: Set[str] = set()
+_held_lock = threading.Lock()
+
+
+class FileLock:
+    """
+    Межпроцессная блокировка через flock на файле в TEMP_STORAGE_PATH/locks.
+    Не привязана к потоку: может быть взята в одном потоке и отпущена в другом
+    (например, между стадиями скачивания и конвертации). При падении процесса
+    блокировку снимает ОС.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        """Неблокирующий захват. False - блокировку держит другой поток или процесс"""
+        with _held_lock:
+            if self.path in _held:
+                return False
+            _held.add(self.path)
+
+        if fcntl is None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            with _held_lock:
+                _held.discard(self.path)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        with _held_lock:
+            _held.discard(self.path)
+
+
+def audiobook_lock(audiobook_id: int) -> FileLock:
+    """Блокировка файлов аудиокниги (скачивание, конвертация, renditions)"""
+    os.makedirs(LOCKS_PATH, exist_ok=True)
+    return FileLock(os.path.join(LOCKS_PATH, f"audiobook_{audiobook_id}.lock"))
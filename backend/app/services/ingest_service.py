@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+
+class IngestService:
+    """
+    Массовая запись плейлистов/аудиокниг по youtube_id.
+    Вместо SELECT на каждую запись: один IN запрос на пачку, затем
+    INSERT ... ON CONFLICT (youtube_id) DO UPDATE для новых и изменённых строк.
+    """
+
+    def upsert(
+        self,
+        db: Session,
+        model,
+        rows: List[Dict],
+        update_fields: Sequence[str] = ('title', 'thumbnail_url'),
+    ) -> Dict[str, int]:
+        """
+        Запись rows (dict с колонками модели, включая youtube_id), без commit.
+        Для существующих строк обновляются только update_fields, и только
+        непустыми значениями. Возвращает счётчики inserted/updated/unchanged.
+        """
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        # Дубликаты внутри одного вызова: последняя запись побеждает
+        rows = list({row['youtube_id']: row for row in rows if row.get('youtube_id')}.values())
+
+        batch_size = settings.INGEST_BATCH_SIZE
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            existing = {
+                row.youtube_id: row
+                for row in db.execute(
+                    select(model.youtube_id, *[getattr(model, f) for f in update_fields])
+                    .where(model.youtube_id.in_([r['youtube_id'] for r in batch]))
+                )
+            }
+
+            to_write = []
+            for row in batch:
+                current = existing.get(row['youtube_id'])
+                if current is None:
+                    stats["inserted"] += 1
+                    to_write.append(row)
+                elif any(
+                    row.get(f) is not None and row.get(f) != getattr(current, f)
+                    for f in update_fields
+                ):
+                    stats["updated"] += 1
+                    to_write.append(row)
+                else:
+                    stats["unchanged"] += 1
+
+            if to_write:
+                self._write(db, model, to_write, update_fields)
+
+        return stats
+
+    def _write(self, db: Session, model, rows: List[Dict], update_fields: Sequence[str]):
+        dialect = db.get_bind().dialect.name
+        if dialect == 'sqlite':
+            insert = sqlite.insert
+        elif dialect == 'postgresql':
+            insert = postgresql.insert
+        else:
+            self._write_orm(db, model, rows, update_fields)
+            return
+
+        stmt = insert(model).values(rows)
+        set_ = {
+            f: func.coalesce(getattr(stmt.excluded, f), getattr(model, f))
+            for f in update_fields
+        }
+        if hasattr(model, 'updated_at'):
+            set_['updated_at'] = datetime.utcnow()
+        db.execute(stmt.on_conflict_do_update(index_elements=['youtube_id'], set_=set_))
+
+    def _write_orm(self, db: Session, model, rows: List[Dict], update_fields: Sequence[str]):
+        """Запасной путь для диалектов без ON CONFLICT"""
+        existing = {
+            obj.youtube_id: obj
+            for obj in db.query(model).filter(model.youtube_id.in_([r['youtube_id'] for r in rows]))
+        }
+        for row in rows:
+            obj = existing.get(row['youtube_id'])
+            if obj is None:
+                db.add(model(**row))
+                continue
+            for f in update_fields:
+                if row.get(f) is not None:
+                    setattr(obj, f, row[f])
+        db.flush()
+
+
+# Singleton instance
+ingest_service = IngestService()
@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+# Пресеты дополнительных renditions для речи.
+# Opus в режиме voip на 32-48 kbps mono даёт разборчивую речь при ~5x меньшем размере, чем mp3 192.
+RENDITION_PRESETS: Dict[str, Dict] = {
+    'speech-32': {'codec': 'libopus', 'ext': 'opus', 'bitrate': 32, 'channels': 1},
+    'speech-48': {'codec': 'libopus', 'ext': 'opus', 'bitrate': 48, 'channels': 1},
+    'speech-64-aac': {'codec': 'aac', 'ext': 'm4a', 'bitrate': 64, 'channels': 1},
+}
+
+# Кодеки итогового файла: encoder ffmpeg, расширение и исходные кодеки, которые копируются без перекодирования
+AUDIO_CODECS: Dict[str, Dict] = {
+    'mp3': {'encoder': 'libmp3lame', 'ext': 'mp3', 'copy_from': ('mp3',)},
+    'm4a': {'encoder': 'aac', 'ext': 'm4a', 'copy_from': ('aac',)},
+    'aac': {'encoder': 'aac', 'ext': 'm4a', 'copy_from': ('aac',)},
+    'opus': {'encoder': 'libopus', 'ext': 'opus', 'copy_from': ('opus',)},
+    'vorbis': {'encoder': 'libvorbis', 'ext': 'ogg', 'copy_from': ('vorbis',)},
+    'flac': {'encoder': 'flac', 'ext': 'flac', 'copy_from': ('flac',)},
+    'wav': {'encoder': 'pcm_s16le', 'ext': 'wav', 'copy_from': ()},
+}
+
+
+class MediaService:
+    def probe(self, path: str) -> Dict:
+        """Кодек первой аудиодорожки и длительность файла через ffprobe"""
+        output = subprocess.run(
+            [
+                'ffprobe', '-v', 'error',
+                '-select_streams', 'a:0',
+                '-show_entries', 'stream=codec_name:format=duration',
+                '-of', 'json',
+                path,
+            ],
+            check=True, capture_output=True, text=True
+        ).stdout
+        data = json.loads(output or '{}')
+        streams = data.get('streams') or [{}]
+        duration = (data.get('format') or {}).get('duration')
+        return {
+            'codec': streams[0].get('codec_name'),
+            'duration': float(duration) if duration else None,
+        }
+
+    def extract_audio(
+        self,
+        source_path: str,
+        output_base: str,
+        codec: Optional[str] = None,
+        quality: Optional[str] = None
+    ) -> str:
+        """
+        Конвертация скачанного исходного файла в итоговый (CPU стадия).
+        codec None - файл сохраняется как есть; quality None - remux: поток копируется
+        в контейнер codec, а если исходный кодек несовместим (yt-dlp выбрал запасной
+        формат), файл остаётся в исходном контейнере без перекодирования.
+        Исходный файл удаляется. Возвращает путь итогового файла.
+        """
+        target = AUDIO_CODECS.get(codec) if codec is not None else None
+        if codec is not None and not target:
+            raise ValueError(f"Unsupported audio codec: {codec}")
+
+        if target and quality is None:
+            source_codec = self.probe(source_path)['codec']
+            if source_codec not in target['copy_from']:
+                print(f"[Media Service] Remux в {codec} невозможен для {source_codec}, файл сохранён как есть")
+                target = None
+
+        if target is None:
+            output_path = output_base + os.path.splitext(source_path)[1]
+            os.replace(source_path, output_path)
+            return output_path
+
+        output_path = f"{output_base}.{target['ext']}"
+
+        command = ['ffmpeg', '-y', '-v', 'error', '-i', source_path, '-vn']
+        if quality is None:
+            command += ['-c:a', 'copy']
+        else:
+            command += ['-c:a', target['encoder'], '-b:a', f"{quality}k"]
+
+        print(f"[Media Service] Конвертация: {output_path}")
+        self._run_ffmpeg(command, output_path)
+        os.remove(source_path)
+        return output_path
+
+    def verify_audio(self, path: str, expected_duration: Optional[float] = None) -> Dict:
+        """
+        Проверка готового файла перед тем, как пометить книгу скачанной:
+        файл не пустой, есть аудиодорожка, длительность совпадает с YouTube
+        (с допуском DOWNLOAD_DURATION_TOLERANCE). Иначе ValueError.
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            raise ValueError(f"Audio file is missing or empty: {path}")
+
+        info = self.probe(path)
+        if not info['codec']:
+            raise ValueError(f"No audio stream in {path}")
+
+        if expected_duration and info['duration'] is not None:
+            tolerance = max(settings.DOWNLOAD_DURATION_TOLERANCE, expected_duration * 0.01)
+            if abs(info['duration'] - expected_duration) > tolerance:
+                raise ValueError(
+                    f"Duration mismatch for {path}: {info['duration']:.1f}s, expected {expected_duration:.1f}s"
+                )
+        return info
+
+    def transcode_rendition(self, source_path: str, output_path: str, preset_name: str):
+        """Перекодирование файла в rendition по пресету через ffmpeg"""
+        preset = RENDITION_PRESETS[preset_name]
+        command = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', source_path,
+            '-vn',
+            '-ac', str(preset['channels']),
+            '-c:a', preset['codec'],
+            '-b:a', f"{preset['bitrate']}k",
+        ]
+        if preset['codec'] == 'libopus':
+            command += ['-application', 'voip']
+
+        print(f"[Media Service] Rendition {preset_name}: {output_path}")
+        self._run_ffmpeg(command, output_path)
+
+    def package_hls(self, source_path: str, output_dir: str, segment_seconds: int) -> str:
+        """
+        Нарезка файла на HLS сегменты (MPEG-TS) и VOD плейлист index.m3u8.
+        MP3/AAC копируются без перекодирования, остальное кодируется в AAC.
+        В именах сегментов время упаковки: при перепаковке URL меняются,
+        поэтому сегменты можно кэшировать как неизменяемые.
+        Каталог собирается во временном и подменяется целиком.
+        Возвращает путь к index.m3u8.
+        """
+        part_dir = f"{output_dir}.part"
+        shutil.rmtree(part_dir, ignore_errors=True)
+        os.makedirs(part_dir)
+
+        command = ['ffmpeg', '-y', '-v', 'error', '-i', source_path, '-vn']
+        if self.probe(source_path)['codec'] in ('mp3', 'aac'):
+            command += ['-c:a', 'copy']
+        else:
+            command += ['-c:a', 'aac', '-b:a', f"{settings.AUDIO_QUALITY}k"]
+        command += [
+            '-f', 'hls',
+            '-hls_time', str(segment_seconds),
+            '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', os.path.join(part_dir, f'segment_{int(time.time())}_%05d.ts'),
+            os.path.join(part_dir, 'index.m3u8'),
+        ]
+
+        print(f"[Media Service] HLS: {output_dir}")
+        try:
+            subprocess.run(command, check=True, capture_output=True)
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.replace(part_dir, output_dir)
+        finally:
+            shutil.rmtree(part_dir, ignore_errors=True)
+        return os.path.join(output_dir, 'index.m3u8')
+
+    def _run_ffmpeg(self, command: List[str], output_path: str):
+        """
+        Запись во временный файл рядом с итоговым и атомарный rename:
+        после падения процесса не остаётся обрезанных файлов под итоговым именем.
+        """
+        root, ext = os.path.splitext(output_path)
+        part_path = f"{root}.part{ext}"  # ffmpeg определяет формат по расширению
+        try:
+            subprocess.run(command + [part_path], check=True, capture_output=True)
+            os.replace(part_path, output_path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+
+# Singleton instance
+media_service = MediaService()
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.audiobook import Audiobook
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+@dataclass
+class _Subscriber:
+    loop: asyncio.AbstractEventLoop
+    event: asyncio.Event
+    state: Optional[Dict]  # последнее опубликованное состояние
+
+
+class ProgressTracker:
+    """
+    Прогресс загрузок аудиокниг.
+    Последнее значение хранится в памяти и рассылается подписчикам (SSE),
+    а в БД (download_progress) пишется не чаще раза в PROGRESS_DB_INTERVAL секунд.
+    Промежуточные значения схлопываются: подписчик получает только последнее.
+    После done/failed состояние рассылается подписчикам и удаляется из памяти.
+    """
+
+    def __init__(self, db_interval: float):
+        self.db_interval = db_interval
+        self._state: Dict[int, Dict] = {}
+        self._last_db_write: Dict[int, float] = {}
+        self._subscribers: Dict[int, List[_Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, audiobook_id: int) -> Optional[Dict]:
+        with self._lock:
+            state = self._state.get(audiobook_id)
+            return dict(state) if state else None
+
+    def start(self, audiobook_id: int):
+        """Начало (или повтор) загрузки: сбрасываем прошлое состояние"""
+        with self._lock:
+            self._state.pop(audiobook_id, None)
+            self._last_db_write.pop(audiobook_id, None)
+        self.update(audiobook_id, status="downloading", progress=1.0)
+
+    def update(self, audiobook_id: int, persist: bool = True, **fields):
+        """
+        persist=False - только память и подписчики: для вызывающих, которые уже
+        записали статус в своей транзакции (постановка в очередь из API).
+        Троттлированная запись в БД остаётся для потоков воркеров.
+        """
+        with self._lock:
+            state = self._state.setdefault(audiobook_id, {"audiobook_id": audiobook_id, "version": 0})
+            state.update(fields)
+            state["version"] += 1
+            progress = state.get("progress")
+            now = time.monotonic()
+            write_db = (
+                persist
+                and progress is not None
+                and state.get("status") not in TERMINAL_STATUSES
+                and now - self._last_db_write.get(audiobook_id, 0) >= self.db_interval
+            )
+            if write_db:
+                self._last_db_write[audiobook_id] = now
+            # Снимок под той же блокировкой: подписчики не получат состояния не по порядку
+            snapshot = dict(state)
+            for subscriber in self._subscribers.get(audiobook_id, []):
+                subscriber.state = snapshot
+            if state.get("status") in TERMINAL_STATUSES:
+                # Завершённые загрузки не копятся в памяти: финал уже у текущих подписчиков
+                self._state.pop(audiobook_id, None)
+                self._last_db_write.pop(audiobook_id, None)
+
+        if write_db:
+            self._write_progress(audiobook_id, progress)
+        self._publish(audiobook_id)
+
+    def finish(self, audiobook_id: int, status: str, error: Optional[str] = None):
+        """Финальное состояние; в БД его записывает сам download_and_convert / очередь"""
+        fields = {"status": status, "error": error}
+        if status == "done":
+            fields.update(progress=100.0, eta=0)
+        self.update(audiobook_id, **fields)
+
+    def hook(self, audiobook_id: int) -> Callable[[Dict], None]:
+        """progress_hook для yt-dlp"""
+        def progress_hook(d: Dict):
+            if d.get('status') == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                downloaded = d.get('downloaded_bytes') or 0
+                fields = {
+                    "status": "downloading",
+                    "downloaded_bytes": downloaded,
+                    "total_bytes": total,
+                    "speed": d.get('speed'),
+                    "eta": d.get('eta'),
+                }
+                if total:
+                    # 100% ставится только после конвертации
+                    fields["progress"] = min(downloaded / total * 100, 99.0)
+                self.update(audiobook_id, **fields)
+            elif d.get('status') == 'finished':
+                self.update(audiobook_id, status="converting", progress=99.0, speed=None, eta=None)
+        return progress_hook
+
+    async def subscribe(self, audiobook_id: int, keepalive: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+        """
+        Поток изменений состояния. None - keepalive (изменений не было).
+        Завершается после done/failed.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._state.get(audiobook_id)
+            subscriber = _Subscriber(loop, asyncio.Event(), dict(state) if state else None)
+            self._subscribers.setdefault(audiobook_id, []).append(subscriber)
+
+        try:
+            last_version = None
+            while True:
+                subscriber.event.clear()
+                state = subscriber.state
+                if state and state["version"] != last_version:
+                    last_version = state["version"]
+                    yield state
+                    if state.get("status") in TERMINAL_STATUSES:
+                        return
+                try:
+                    await asyncio.wait_for(subscriber.event.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(audiobook_id, [])
+                if subscriber in subscribers:
+                    subscribers.remove(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(audiobook_id, None)
+
+    def _publish(self, audiobook_id: int):
+        with self._lock:
+            subscribers = list(self._subscribers.get(audiobook_id, []))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.event.set)
+            except RuntimeError:
+                # Event loop уже закрыт
+                pass
+
+    def _write_progress(self, audiobook_id: int, progress: float):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Audiobook)
+                .where(Audiobook.id == audiobook_id)
+                .values(download_progress=progress, updated_at=Audiobook.updated_at)
+            )
+            db.commit()
+        except Exception as e:
+            print(f"[Progress] Ошибка записи прогресса {audiobook_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+# Singleton instance
+progress_tracker = ProgressTracker(db_interval=settings.PROGRESS_DB_INTERVAL)
@@ -0,0 +1,240 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Окончания русских слов (от длинных к коротким). Запрос ищет по основе как по
+# префиксу: "книгой" -> "книг"* находит книга/книги/книгу
+RUSSIAN_ENDINGS = sorted([
+    "иями", "ями", "ами", "ией", "ием", "иях", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ешь", "ете", "ишь", "ите", "ает", "яет", "ают", "яют", "ться", "тся", "ть",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ые", "ие", "ых", "их", "ую", "юю",
+    "ом", "ем", "ам", "ям", "ах", "ях", "ию", "ия", "ии", "ов", "ев", "ет", "ит", "ут", "ют", "ат", "ят",
+    "ы", "и", "а", "я", "о", "е", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+MIN_STEM = 3
+
+
+@dataclass
+class SearchSource:
+    """Таблица, попадающая в индекс: заголовок, текст и id родителя для навигации"""
+    table: str
+    code: int  # rowid в индексе = id * 4 + code, чтобы триггеры удаляли по ключу
+    title: str
+    body: Sequence[str]
+    parent: str
+
+
+SEARCH_SOURCES: Dict[str, SearchSource] = {
+    "audiobook": SearchSource("audiobooks", 1, "title", ("description", "ai_summary"), "playlist_id"),
+    "playlist": SearchSource("playlists", 2, "title", ("author",), "channel_id"),
+    "note": SearchSource("notes", 3, "quote", ("content",), "audiobook_id"),
+}
+
+
+def russian_prefix(word: str) -> str:
+    """Грубый стемминг для запроса: отрезаем окончание, оставляя основу не короче MIN_STEM"""
+    if not CYRILLIC_RE.search(word):
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def fts5_query(query: str) -> Optional[str]:
+    """
+    Запрос пользователя -> MATCH выражение FTS5: все слова (AND), каждое как префикс основы.
+    Короткие слова ("и", "в") ищутся целиком, иначе префикс совпал бы почти со всем.
+    """
+    words = WORD_RE.findall(query.lower().replace('ё', 'е'))
+    if not words:
+        return None
+    return " ".join(
+        f'"{russian_prefix(word)}"*' if len(word) >= MIN_STEM else f'"{word}"'
+        for word in words
+    )
+
+
+class SearchService:
+    """
+    Полнотекстовый поиск по аудиокнигам (title, description, ai_summary),
+    плейлистам (title, author) и заметкам (quote, content).
+    SQLite: виртуальная таблица FTS5 search_index (unicode61, регистр кириллицы,
+    ё -> е, основы русских слов в запросе), PostgreSQL: search_documents с tsvector
+    по конфигурации 'russian' и GIN индексом. В обоих случаях индекс
+    поддерживают триггеры БД, поэтому его не обходит ни ORM, ни массовый upsert.
+    """
+
+    def __init__(self):
+        self.backend: Optional[str] = None
+
+    def install(self, engine: Engine):
+        """Создание индекса и триггеров (идемпотентно), заполнение нового индекса"""
+        dialect = engine.dialect.name
+        try:
+            with engine.begin() as conn:
+                if dialect == "sqlite":
+                    self._install_sqlite(conn)
+                elif dialect == "postgresql":
+                    self._install_postgres(conn)
+                else:
+                    return
+            self.backend = dialect
+        except Exception as e:
+            print(f"[Search] Полнотекстовый индекс недоступен: {e}")
+
+    def rebuild(self, engine: Engine):
+        """Полная переиндексация (например, после ручных правок БД без триггеров)"""
+        table = "search_index" if self.backend == "sqlite" else "search_documents"
+        with engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {table}"))
+            self._backfill(conn, table)
+
+    async def search(self, db: AsyncSession, query: str, kinds: Sequence[str], limit: int) -> List[Dict]:
+        if self.backend == "sqlite":
+            match = fts5_query(query)
+            if not match:
+                return []
+            result = await db.execute(text(self._sqlite_search_sql(kinds)), {"match": match, "limit": limit})
+        elif self.backend == "postgresql":
+            if not WORD_RE.search(query):
+                return []
+            result = await db.execute(text(self._postgres_search_sql(kinds)), {"query": query, "limit": limit})
+        else:
+            raise RuntimeError("Search index is not available")
+        return [dict(row._mapping) for row in result]
+
+    # SQLite FTS5
+
+    def _install_sqlite(self, conn: Connection):
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )).first()
+        if not exists:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE search_index USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, parent_id UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+
+        for kind, source in SEARCH_SOURCES.items():
+            delete = f"DELETE FROM search_index WHERE rowid = old.id * 4 + {source.code};"
+            insert = (
+                "INSERT INTO search_index(rowid, kind, ref_id, parent_id, title, body) VALUES ("
+                f"new.id * 4 + {source.code}, '{kind}', new.id, new.{source.parent}, "
+                f"{self._sqlite_text('new', [source.title])}, {self._sqlite_text('new', source.body)});"
+            )
+            columns = ", ".join([source.title, *source.body, source.parent])
+            triggers = {
+                "ai": f"AFTER INSERT ON {source.table} BEGIN {insert} END",
+                "ad": f"AFTER DELETE ON {source.table} BEGIN {delete} END",
+                # Только при изменении индексируемых колонок, не на каждый прогресс загрузки
+                "au": f"AFTER UPDATE OF {columns} ON {source.table} BEGIN {delete} {insert} END",
+            }
+            for suffix, body in triggers.items():
+                name = f"search_{source.table}_{suffix}"
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+                conn.execute(text(f"CREATE TRIGGER {name} {body}"))
+
+        if not exists:
+            self._backfill(conn, "search_index")
+
+    def _sqlite_text(self, row: str, columns: Sequence[str]) -> str:
+        joined = " || ' ' || ".join(f"coalesce({row}.{column}, '')" for column in columns)
+        return f"replace(replace(trim({joined}), 'ё', 'е'), 'Ё', 'Е')"
+
+    def _sqlite_search_sql(self, kinds: Sequence[str]) -> str:
+        # bm25: меньше - лучше; совпадение в заголовке весит в 5 раз больше, чем в тексте
+        return (
+            "SELECT kind, ref_id AS id, parent_id, title, "
+            f"snippet(search_index, 4, '{SNIPPET_START}', '{SNIPPET_END}', '…', 16) AS snippet, "
+            "-bm25(search_index, 0, 0, 0, 5.0, 1.0) AS rank "
+            "FROM search_index WHERE search_index MATCH :match"
+            f"{self._kind_filter(kinds)} ORDER BY bm25(search_index, 0, 0, 0, 5.0, 1.0) LIMIT :limit"
+        )
+
+    # PostgreSQL tsvector
+
+    def _install_postgres(self, conn: Connection):
+        exists = conn.execute(text("SELECT to_regclass('search_documents')")).scalar()
+        if not exists:
+            conn.execute(text(
+                "CREATE TABLE search_documents ("
+                "id BIGINT PRIMARY KEY, kind VARCHAR NOT NULL, ref_id INTEGER NOT NULL, "
+                "parent_id INTEGER, title TEXT, body TEXT, "
+                "tsv TSVECTOR GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('russian', coalesce(body, '')), 'B')) STORED)"
+            ))
+            conn.execute(text("CREATE INDEX ix_search_documents_tsv ON search_documents USING GIN (tsv)"))
+
+        for kind, source in SEARCH_SOURCES.items():
+            function = f"search_sync_{source.table}"
+            conn.execute(text(
+                f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ BEGIN "
+                f"IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+                f"DELETE FROM search_documents WHERE id = OLD.id * 4 + {source.code}; END IF; "
+                f"IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+                f"INSERT INTO search_documents(id, kind, ref_id, parent_id, title, body) VALUES ("
+                f"NEW.id * 4 + {source.code}, '{kind}', NEW.id, NEW.{source.parent}, NEW.{source.title}, "
+                f"concat_ws(' ', {', '.join(f'NEW.{column}' for column in source.body)})); END IF; "
+                f"RETURN NULL; END $$ LANGUAGE plpgsql"
+            ))
+            columns = ", ".join([source.title, *source.body, source.parent])
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {function} ON {source.table}"))
+            conn.execute(text(
+                f"CREATE TRIGGER {function} AFTER INSERT OR DELETE OR UPDATE OF {columns} "
+                f"ON {source.table} FOR EACH ROW EXECUTE FUNCTION {function}()"
+            ))
+
+        if not exists:
+            self._backfill(conn, "search_documents")
+
+    def _postgres_search_sql(self, kinds: Sequence[str]) -> str:
+        # ts_headline дорогой - считаем его только для строк страницы
+        return (
+            "SELECT kind, id, parent_id, title, "
+            "ts_headline('russian', coalesce(body, ''), q, "
+            f"'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=24, MinWords=8') AS snippet, rank "
+            "FROM (SELECT kind, ref_id AS id, parent_id, title, body, q, ts_rank_cd(tsv, q) AS rank "
+            "FROM search_documents, websearch_to_tsquery('russian', :query) q "
+            f"WHERE tsv @@ q{self._kind_filter(kinds)} ORDER BY rank DESC LIMIT :limit) page "
+            "ORDER BY rank DESC"
+        )
+
+    # Общее
+
+    def _kind_filter(self, kinds: Sequence[str]) -> str:
+        # kinds проверены роутером по SEARCH_SOURCES
+        if not kinds or set(kinds) >= set(SEARCH_SOURCES):
+            return ""
+        return " AND kind IN (" + ", ".join(f"'{kind}'" for kind in kinds if kind in SEARCH_SOURCES) + ")"
+
+    def _backfill(self, conn: Connection, table: str):
+        for kind, source in SEARCH_SOURCES.items():
+            if table == "search_index":
+                title = self._sqlite_text(source.table, [source.title])
+                body = self._sqlite_text(source.table, source.body)
+            else:
+                title = f"{source.table}.{source.title}"
+                body = f"concat_ws(' ', {', '.join(f'{source.table}.{column}' for column in source.body)})"
+            result = conn.execute(text(
+                f"INSERT INTO {table}({'rowid' if table == 'search_index' else 'id'}, kind, ref_id, parent_id, title, body) "
+                f"SELECT {source.table}.id * 4 + {source.code}, '{kind}', {source.table}.id, "
+                f"{source.table}.{source.parent}, {title}, {body} FROM {source.table}"
+            ))
+            print(f"[Search] Проиндексировано {kind}: {result.rowcount}")
+
+
+# Singleton instance
+search_service = SearchService()
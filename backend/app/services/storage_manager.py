@@ -0,0 +1,216 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.audiobook import Audiobook
+from app.models.audio_rendition import AudioRendition
+from app.services.download_service import from_audio_url
+from app.services.file_lock import audiobook_lock
+
+
+class StorageManager:
+    """
+    Квота на AUDIO_STORAGE_PATH и LRU вытеснение.
+    Время последнего доступа и счётчик прослушиваний пишутся из /audio,
+    /api/audio и stream эндпоинтов (не чаще раза в access_write_interval
+    на книгу, прослушивания между записями копятся в памяти). При превышении
+    квоты удаляются файлы давно не слушанных книг, кроме закреплённых,
+    а книга снова становится нескачанной.
+    """
+
+    def __init__(self, quota_bytes: int, access_write_interval: float):
+        self.quota_bytes = quota_bytes
+        self.access_write_interval = access_write_interval
+        self._last_touch: Dict = {}
+        self._pending_plays: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, audiobook_id: int, plays: int = 0):
+        """Отметка доступа к книге; plays - начатые прослушивания (запрос с начала файла)"""
+        if plays:
+            with self._lock:
+                self._pending_plays[audiobook_id] = self._pending_plays.get(audiobook_id, 0) + plays
+        if not self._should_write(('book', audiobook_id)):
+            return
+        self._write_access(audiobook_id)
+
+    def flush(self):
+        """Запись накопленных прослушиваний (при остановке приложения)"""
+        with self._lock:
+            audiobook_ids = list(self._pending_plays)
+        for audiobook_id in audiobook_ids:
+            self._write_access(audiobook_id)
+
+    def _write_access(self, audiobook_id: int):
+        with self._lock:
+            plays = self._pending_plays.pop(audiobook_id, 0)
+
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Audiobook)
+                .where(Audiobook.id == audiobook_id)
+                .values(
+                    last_accessed_at=datetime.utcnow(),
+                    play_count=func.coalesce(Audiobook.play_count, 0) + plays,
+                    updated_at=Audiobook.updated_at
+                )
+            )
+            db.commit()
+        except Exception as e:
+            print(f"[Storage] Ошибка записи доступа {audiobook_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def touch_path(self, path: str):
+        """Отметка доступа по пути внутри /audio (оригинал или rendition)"""
+        audio_url = f"/audio/{path.lstrip('/')}"
+        if not self._should_write(('path', audio_url)):
+            return
+
+        db = SessionLocal()
+        try:
+            audiobook_id = db.query(Audiobook.id).filter(
+                Audiobook.audio_file_path == audio_url
+            ).scalar() or db.query(AudioRendition.audiobook_id).filter(
+                AudioRendition.audio_file_path == audio_url
+            ).scalar()
+        finally:
+            db.close()
+
+        if audiobook_id:
+            self.touch(audiobook_id)
+
+    def usage(self, db: Session) -> int:
+        """Занятое место по данным БД: оригиналы, HLS сегменты и renditions"""
+        books = db.query(
+            func.coalesce(func.sum(Audiobook.file_size), 0) + func.coalesce(func.sum(Audiobook.hls_size), 0)
+        ).filter(
+            Audiobook.is_downloaded == True
+        ).scalar()
+        renditions = db.query(func.coalesce(func.sum(AudioRendition.file_size), 0)).scalar()
+        return int(books + renditions)
+
+    def stats(self, db: Session) -> Dict:
+        used = self.usage(db)
+        return {
+            "quota_bytes": self.quota_bytes or None,
+            "used_bytes": used,
+            "free_bytes": max(self.quota_bytes - used, 0) if self.quota_bytes else None,
+            "pinned": db.query(Audiobook).filter(
+                Audiobook.is_downloaded == True, Audiobook.is_pinned == True
+            ).count(),
+        }
+
+    def enforce_quota(self, db: Session, exclude: Optional[int] = None) -> List[int]:
+        """
+        Вытеснение наименее давно прослушанных книг, пока занятое место
+        больше квоты. Книги, которые сейчас скачиваются (заблокированы), пропускаются.
+        Возвращает id вытесненных книг.
+        """
+        if not self.quota_bytes:
+            return []
+
+        used = self.usage(db)
+        if used <= self.quota_bytes:
+            return []
+
+        candidates = db.query(Audiobook).filter(
+            Audiobook.is_downloaded == True,
+            Audiobook.is_pinned != True,
+        ).order_by(
+            func.coalesce(Audiobook.last_accessed_at, Audiobook.updated_at, Audiobook.created_at),
+            Audiobook.id
+        )
+
+        evicted = []
+        for audiobook in candidates.all():
+            if used <= self.quota_bytes:
+                break
+            if audiobook.id == exclude:
+                continue
+            freed = self.evict(db, audiobook)
+            if freed is not None:
+                used -= freed
+                evicted.append(audiobook.id)
+
+        db.commit()
+        if evicted:
+            print(f"[Storage] Вытеснено книг: {len(evicted)}, занято {used} из {self.quota_bytes} байт")
+        return evicted
+
+    def evict(self, db: Session, audiobook: Audiobook) -> Optional[int]:
+        """
+        Удаление файлов книги (оригинал, HLS и renditions) без удаления записи.
+        None - книга сейчас обрабатывается. Без commit.
+        """
+        lock = audiobook_lock(audiobook.id)
+        if not lock.acquire():
+            return None
+        try:
+            freed, paths = self.detach_files(db, audiobook)
+            self.remove_files(paths)
+            return freed
+        finally:
+            lock.release()
+
+    def detach_files(self, db: Session, audiobook: Audiobook) -> Tuple[int, List[str]]:
+        """
+        Часть evict без файловой системы: удаляет renditions и сбрасывает поля файлов
+        книги. Возвращает (освобождаемые байты, пути для remove_files).
+        Блокировку audiobook_lock держит вызывающий. Без commit.
+        """
+        freed = (audiobook.file_size or 0) + (audiobook.hls_size or 0)
+        audio_urls = [audiobook.audio_file_path]
+        for rendition in list(audiobook.renditions):
+            freed += rendition.file_size or 0
+            audio_urls.append(rendition.audio_file_path)
+            db.delete(rendition)
+
+        paths = [from_audio_url(audio_url) for audio_url in audio_urls if audio_url]
+        if audiobook.hls_playlist_path:
+            paths.append(os.path.dirname(from_audio_url(audiobook.hls_playlist_path)))
+
+        audiobook.audio_file_path = None
+        audiobook.file_size = None
+        audiobook.hls_playlist_path = None
+        audiobook.hls_size = None
+        audiobook.is_downloaded = False
+        audiobook.is_converted = False
+        audiobook.download_progress = 0.0
+        return freed, paths
+
+    def remove_files(self, paths: List[str]):
+        """Удаление файлов и каталогов (HLS) из detach_files. Блокирующий вызов - не в event loop"""
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                try:
+                    os.remove(path)
+                except Exception as e:
+                    print(f"[Storage] Ошибка удаления {path}: {e}")
+
+    def _should_write(self, key) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_touch.get(key, -self.access_write_interval) < self.access_write_interval:
+                return False
+            self._last_touch[key] = now
+            return True
+
+
+# Singleton instance
+storage_manager = StorageManager(
+    quota_bytes=settings.STORAGE_QUOTA_BYTES,
+    access_write_interval=settings.STORAGE_ACCESS_WRITE_INTERVAL,
+)
@@ -0,0 +1,301 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.audiobook import Audiobook
+from app.models.audio_rendition import AudioRendition
+from app.services.download_service import from_audio_url, to_audio_url
+from app.services.file_lock import audiobook_lock
+
+YOUTUBE_ID_LENGTH = 11
+
+
+def youtube_id_from_filename(filename: str) -> Optional[str]:
+    """
+    'Title_dQw4w9WgXcQ.mp3', 'Title_dQw4w9WgXcQ.speech-32.opus',
+    'Title_dQw4w9WgXcQ.source.webm.part' -> 'dQw4w9WgXcQ'.
+    В безопасном имени нет точек, поэтому stem - всё до первой точки.
+    """
+    stem = filename.split('.', 1)[0]
+    if len(stem) <= YOUTUBE_ID_LENGTH or stem[-YOUTUBE_ID_LENGTH - 1] != '_':
+        return None
+    return stem[-YOUTUBE_ID_LENGTH:]
+
+
+class StorageReconciler:
+    """
+    Фоновая сверка AUDIO_STORAGE_PATH с БД.
+    Файлы и HLS каталоги, на которые не ссылается ни одна аудиокнига или rendition, удаляются
+    (старше orphan_grace и не заблокированные загрузкой), пустые каталоги
+    playlist_* убираются. Записи, чьи файлы пропали, сбрасываются в нескачанные.
+    Работает пачками по batch_size в собственном потоке и сессиях,
+    поэтому большие деревья не задерживают API.
+    """
+
+    def __init__(self, interval: int, batch_size: int, orphan_grace: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.orphan_grace = orphan_grace
+        self.last_run: Optional[Dict] = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._running = threading.Lock()
+
+    def start(self):
+        if self._thread or not self.interval:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="storage-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def trigger(self):
+        """Внеочередной проход (или запуск в отдельном потоке, если фоновый отключён)"""
+        if self._thread:
+            self._wake.set()
+        else:
+            threading.Thread(target=self.run_once, name="storage-reconciler-once", daemon=True).start()
+
+    def run_once(self) -> Optional[Dict]:
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            stats = {
+                "started_at": datetime.utcnow().isoformat(),
+                "files_scanned": 0,
+                "orphans_deleted": 0,
+                "bytes_freed": 0,
+                "dirs_deleted": 0,
+                "audiobooks_reset": 0,
+                "renditions_removed": 0,
+            }
+            self._scan_files(stats)
+            self._check_audiobooks(stats)
+            self._check_renditions(stats)
+            stats["finished_at"] = datetime.utcnow().isoformat()
+            self.last_run = stats
+            print(f"[Storage Reconciler] {stats}")
+            return stats
+        finally:
+            self._running.release()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[Storage Reconciler ERROR] {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _pause(self):
+        """Между пачками отдаём GIL и БД остальным потокам"""
+        time.sleep(0.05)
+
+    def _is_busy(self, audiobook_id: int) -> bool:
+        lock = audiobook_lock(audiobook_id)
+        if not lock.acquire():
+            return True
+        lock.release()
+        return False
+
+    def _scan_files(self, stats: Dict):
+        root = settings.AUDIO_STORAGE_PATH
+        if not os.path.isdir(root):
+            return
+        with os.scandir(root) as entries:
+            directories = [entry.path for entry in entries if entry.is_dir() and entry.name.startswith('playlist_')]
+
+        for directory in directories:
+            if self._stop.is_set():
+                return
+            self._scan_directory(directory, stats)
+            try:
+                if not os.listdir(directory):
+                    os.rmdir(directory)
+                    stats["dirs_deleted"] += 1
+            except OSError:
+                pass
+
+    def _scan_directory(self, directory: str, stats: Dict):
+        with os.scandir(directory) as entries:
+            entries = list(entries)
+        files = [entry for entry in entries if entry.is_file()]
+        hls_dirs = [entry for entry in entries if entry.is_dir() and entry.name.endswith(('.hls', '.hls.part'))]
+
+        if hls_dirs:
+            self._scan_hls_dirs(hls_dirs, stats)
+
+        for start in range(0, len(files), self.batch_size):
+            if self._stop.is_set():
+                return
+            self._scan_batch(files[start:start + self.batch_size], stats)
+            self._pause()
+
+    def _scan_batch(self, files: List[os.DirEntry], stats: Dict):
+        urls = {entry.path: to_audio_url(entry.path) for entry in files}
+        youtube_ids = {youtube_id_from_filename(entry.name) for entry in files} - {None}
+
+        db = SessionLocal()
+        try:
+            referenced = {
+                path for (path,) in db.query(Audiobook.audio_file_path).filter(
+                    Audiobook.audio_file_path.in_(urls.values())
+                )
+            } | {
+                path for (path,) in db.query(AudioRendition.audio_file_path).filter(
+                    AudioRendition.audio_file_path.in_(urls.values())
+                )
+            }
+            books = dict(
+                db.query(Audiobook.youtube_id, Audiobook.id).filter(Audiobook.youtube_id.in_(youtube_ids))
+            ) if youtube_ids else {}
+        finally:
+            db.close()
+
+        now = time.time()
+        for entry in files:
+            stats["files_scanned"] += 1
+            if urls[entry.path] in referenced:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            # Свежие файлы могут принадлежать загрузке в другом процессе
+            if now - stat.st_mtime < self.orphan_grace:
+                continue
+            audiobook_id = books.get(youtube_id_from_filename(entry.name))
+            if audiobook_id and self._is_busy(audiobook_id):
+                continue
+            try:
+                os.remove(entry.path)
+                stats["orphans_deleted"] += 1
+                stats["bytes_freed"] += stat.st_size
+            except OSError as e:
+                print(f"[Storage Reconciler] Ошибка удаления {entry.path}: {e}")
+
+    def _scan_hls_dirs(self, hls_dirs: List[os.DirEntry], stats: Dict):
+        """HLS каталоги (<file>.hls/index.m3u8) без аудиокниги удаляются целиком"""
+        urls = {entry.path: to_audio_url(os.path.join(entry.path, 'index.m3u8')) for entry in hls_dirs}
+        db = SessionLocal()
+        try:
+            referenced = {
+                path for (path,) in db.query(Audiobook.hls_playlist_path).filter(
+                    Audiobook.hls_playlist_path.in_(urls.values())
+                )
+            }
+            books = dict(
+                db.query(Audiobook.youtube_id, Audiobook.id).filter(Audiobook.youtube_id.in_(
+                    {youtube_id_from_filename(entry.name) for entry in hls_dirs} - {None}
+                ))
+            )
+        finally:
+            db.close()
+
+        now = time.time()
+        for entry in hls_dirs:
+            if urls[entry.path] in referenced:
+                continue
+            try:
+                if now - entry.stat().st_mtime < self.orphan_grace:
+                    continue
+            except FileNotFoundError:
+                continue
+            audiobook_id = books.get(youtube_id_from_filename(entry.name))
+            if audiobook_id and self._is_busy(audiobook_id):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            shutil.rmtree(entry.path, ignore_errors=True)
+            stats["orphans_deleted"] += 1
+            stats["bytes_freed"] += size
+
+    def _check_audiobooks(self, stats: Dict):
+        """Скачанные книги без файла на диске -> нескачанные (keyset по id)"""
+        last_id = 0
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                books = db.query(Audiobook).filter(
+                    Audiobook.is_downloaded == True,
+                    Audiobook.id > last_id
+                ).order_by(Audiobook.id).limit(self.batch_size).all()
+                if not books:
+                    return
+                last_id = books[-1].id
+
+                for audiobook in books:
+                    file_path = from_audio_url(audiobook.audio_file_path) if audiobook.audio_file_path else None
+                    if file_path and os.path.exists(file_path):
+                        if audiobook.hls_playlist_path and not os.path.exists(
+                            from_audio_url(audiobook.hls_playlist_path)
+                        ):
+                            audiobook.hls_playlist_path = None
+                            audiobook.hls_size = None
+                            stats["audiobooks_reset"] += 1
+                        continue
+                    if self._is_busy(audiobook.id):
+                        continue
+                    audiobook.hls_playlist_path = None
+                    audiobook.hls_size = None
+                    audiobook.audio_file_path = None
+                    audiobook.file_size = None
+                    audiobook.is_downloaded = False
+                    audiobook.is_converted = False
+                    audiobook.download_progress = 0.0
+                    stats["audiobooks_reset"] += 1
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            self._pause()
+
+    def _check_renditions(self, stats: Dict):
+        """Записи renditions без файла удаляются"""
+        last_id = 0
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                renditions = db.query(AudioRendition).filter(
+                    AudioRendition.id > last_id
+                ).order_by(AudioRendition.id).limit(self.batch_size).all()
+                if not renditions:
+                    return
+                last_id = renditions[-1].id
+
+                for rendition in renditions:
+                    if os.path.exists(from_audio_url(rendition.audio_file_path)):
+                        continue
+                    if self._is_busy(rendition.audiobook_id):
+                        continue
+                    db.delete(rendition)
+                    stats["renditions_removed"] += 1
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            self._pause()
+
+
+# Singleton instance
+storage_reconciler = StorageReconciler(
+    interval=settings.STORAGE_RECONCILE_INTERVAL,
+    batch_size=settings.STORAGE_RECONCILE_BATCH,
+    orphan_grace=settings.STORAGE_ORPHAN_GRACE,
+)
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from app.core.config import settings
+from app.core.executors import extraction_executor
+
+
+@dataclass
+class StreamEntry:
+    url: str
+    expires_at: float
+    http_headers: Dict[str, str]
+
+    def ttl(self, now: Optional[float] = None) -> float:
+        """Сколько секунд URL ещё действителен"""
+        return self.expires_at - (now if now is not None else time.time())
+
+
+def parse_expire(stream_url: str) -> Optional[float]:
+    """
+    Извлечение времени истечения из googlevideo URL.
+    Параметр бывает как в query (?expire=...), так и в пути (/expire/.../).
+    """
+    parsed = urlparse(stream_url)
+    values = parse_qs(parsed.query).get('expire')
+    if values:
+        try:
+            return float(values[0])
+        except ValueError:
+            return None
+
+    parts = parsed.path.split('/')
+    if 'expire' in parts:
+        idx = parts.index('expire')
+        if idx + 1 < len(parts):
+            try:
+                return float(parts[idx + 1])
+            except ValueError:
+                return None
+    return None
+
+
+class StreamURLCache:
+    """
+    LRU кэш прямых stream URL с TTL из параметра expire.
+    За refresh_margin секунд до истечения запись обновляется в фоне
+    (в extraction_executor, при занятом пуле обновление пропускается),
+    чтобы повторные воспроизведения не ждали extract_info.
+    Из async endpoints - resolve(): попадание в кэш не занимает поток пула,
+    а одновременные промахи по одному key ждут одну extraction.
+    """
+
+    def __init__(self, max_size: int, refresh_margin: int, default_ttl: int):
+        self.max_size = max_size
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, StreamEntry]" = OrderedDict()
+        self._refreshing: set = set()
+        self._pending: Dict[str, asyncio.Task] = {}  # промахи в процессе, только из event loop
+        self._lock = threading.Lock()
+
+    def get_or_resolve(self, key: str, resolver: Callable[[], Dict]) -> StreamEntry:
+        """Получение записи из кэша или через resolver (dict с 'url' и 'http_headers'), для потоков"""
+        return self.get(key, resolver) or self._store(key, resolver())
+
+    async def resolve(self, key: str, resolver: Callable[[], Dict]) -> StreamEntry:
+        """Для event loop: кэш без потоков, промах - в extraction_executor, один на key"""
+        entry = self.get(key, resolver)
+        if entry:
+            return entry
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resolve(key, resolver))
+            self._pending[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # shield: отключение одного клиента не отменяет extraction для остальных
+        return await asyncio.shield(task)
+
+    def get(self, key: str, resolver: Callable[[], Dict]) -> Optional[StreamEntry]:
+        """
+        Действующая запись или None, без блокирующих вызовов.
+        resolver нужен для фонового обновления записи, близкой к истечению.
+        """
+        now = time.time()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.ttl(now) > 0:
+                self._entries.move_to_end(key)
+                if entry.ttl(now) <= self.refresh_margin and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    refresh = True
+            elif entry:
+                del self._entries[key]
+                entry = None
+
+        # Обновление через ограниченный extraction_executor; если пул занят - пропускаем,
+        # запись ещё действительна и обновится при следующем обращении
+        if refresh and extraction_executor.try_submit(self._refresh, key, resolver) is None:
+            with self._lock:
+                self._refreshing.discard(key)
+        return entry
+
+    def invalidate(self, key: str):
+        """Удаление записи (например, после 403 от googlevideo)"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def max_age(self, entry: StreamEntry) -> int:
+        """max-age для Cache-Control: клиент не должен держать URL дольше, чем мы"""
+        return max(0, int(entry.ttl() - self.refresh_margin))
+
+    async def _resolve(self, key: str, resolver: Callable[[], Dict]) -> StreamEntry:
+        return self._store(key, await extraction_executor.run(resolver))
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        # Ошибку забирают ожидающие; если все отключились - не логируем "never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def _refresh(self, key: str, resolver: Callable[[], Dict]):
+        try:
+            self._store(key, resolver())
+        except Exception as e:
+            print(f"[Stream Cache] Ошибка фонового обновления {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key: str, resolved: Dict) -> StreamEntry:
+        expires_at = parse_expire(resolved['url']) or time.time() + self.default_ttl
+        entry = StreamEntry(
+            url=resolved['url'],
+            expires_at=expires_at,
+            http_headers=resolved.get('http_headers') or {},
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+
+# Singleton instance
+stream_url_cache = StreamURLCache(
+    max_size=settings.STREAM_CACHE_SIZE,
+    refresh_margin=settings.STREAM_URL_REFRESH_MARGIN,
+    default_ttl=settings.STREAM_URL_DEFAULT_TTL,
+)
@@ -0,0 +1,155 @@
+import re
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.services.stream_cache import StreamEntry
+
+# Заголовки клиента, которые пробрасываем в googlevideo
+FORWARD_REQUEST_HEADERS = ('range', 'if-range')
+
+# Заголовки googlevideo, которые отдаём клиенту
+FORWARD_RESPONSE_HEADERS = (
+    'content-type', 'content-length', 'content-range',
+    'accept-ranges', 'last-modified', 'etag',
+)
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Общий пул соединений к googlevideo на весь процесс"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(settings.STREAM_PROXY_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.STREAM_PROXY_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.STREAM_PROXY_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _parse_content_range(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """'bytes 100-199/1000' -> (100, 199)"""
+    if not value:
+        return None
+    match = CONTENT_RANGE_RE.match(value)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+class StreamProxy:
+    """
+    Проксирование аудио из googlevideo через сервер.
+    Поддерживает Range/If-Range, отдаёт данные чанками фиксированного размера
+    и при 403 или обрыве соединения переполучает URL и продолжает с того же байта.
+    """
+
+    def __init__(self, resolve: Callable[[bool], Awaitable[StreamEntry]]):
+        # resolve(force) -> StreamEntry; force=True сбрасывает кэш URL
+        self.resolve = resolve
+        self.chunk_size = settings.STREAM_PROXY_CHUNK_SIZE
+        self.max_retries = settings.STREAM_PROXY_MAX_RETRIES
+
+    async def _open(self, headers: Dict[str, str], force: bool = False) -> httpx.Response:
+        """Открытие upstream запроса; на 403 переполучаем URL и пробуем снова"""
+        client = get_client()
+        for attempt in range(self.max_retries + 1):
+            entry = await self.resolve(force or attempt > 0)
+            request = client.build_request(
+                'GET', entry.url, headers={**entry.http_headers, **headers}
+            )
+            response = await client.send(request, stream=True)
+            if response.status_code != 403:
+                return response
+            await response.aclose()
+            print(f"[Stream Proxy] 403 от upstream, переполучаем URL (попытка {attempt + 1})")
+        raise httpx.HTTPStatusError(
+            "Upstream returned 403", request=request, response=response
+        )
+
+    async def open(self, request_headers) -> StreamingResponse:
+        headers = {
+            name: request_headers[name]
+            for name in FORWARD_REQUEST_HEADERS
+            if name in request_headers
+        }
+        upstream = await self._open(headers)
+
+        if upstream.status_code >= 400:
+            status = upstream.status_code
+            await upstream.aclose()
+            return StreamingResponse(iter(()), status_code=status)
+
+        # Границы отдаваемого диапазона нужны, чтобы продолжить после обрыва
+        content_range = _parse_content_range(upstream.headers.get('content-range'))
+        if content_range:
+            start, end = content_range
+        else:
+            start = 0
+            length = upstream.headers.get('content-length')
+            end = int(length) - 1 if length else None
+
+        response_headers = {
+            name: upstream.headers[name]
+            for name in FORWARD_RESPONSE_HEADERS
+            if name in upstream.headers
+        }
+        response_headers.setdefault('accept-ranges', 'bytes')
+
+        return StreamingResponse(
+            self._relay(upstream, start, end),
+            status_code=upstream.status_code,
+            headers=response_headers,
+        )
+
+    async def _relay(self, upstream: httpx.Response, start: int, end: Optional[int]) -> AsyncIterator[bytes]:
+        position = start
+        resumed_at = start
+        retries = 0
+        try:
+            while True:
+                try:
+                    async for chunk in upstream.aiter_bytes(self.chunk_size):
+                        position += len(chunk)
+                        yield chunk
+                except httpx.HTTPError as e:
+                    print(f"[Stream Proxy] Обрыв upstream на байте {position}: {e}")
+
+                await upstream.aclose()
+                if end is None or position > end:
+                    return
+
+                # googlevideo оборвал отдачу раньше конца диапазона: переоткрываем.
+                # Счётчик попыток сбрасывается, если с прошлого раза был прогресс
+                retries = 1 if position > resumed_at else retries + 1
+                resumed_at = position
+                if retries > self.max_retries:
+                    print(f"[Stream Proxy] Превышено число переподключений на байте {position}")
+                    return
+                try:
+                    upstream = await self._open(
+                        {'range': f"bytes={position}-{end}"}, force=retries > 1
+                    )
+                except httpx.HTTPError as e:
+                    print(f"[Stream Proxy] Не удалось переоткрыть upstream: {e}")
+                    return
+                if upstream.status_code != 206:
+                    return
+        finally:
+            await upstream.aclose()
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime
+from itertools import chain, islice, takewhile
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.executors import extraction_executor
+from app.models.audiobook import Audiobook
+from app.models.playlist import Playlist
+from app.services.ingest_service import ingest_service
+from app.services.youtube_service import youtube_service
+
+
+class SyncService:
+    def store_playlist_videos(self, db: Session, playlist_id: int, videos: List[Dict]) -> Dict[str, int]:
+        """
+        Запись видео плейлиста как аудиокниг (без commit).
+        Новые добавляются, у существующих обновляются title/thumbnail_url.
+        """
+        rows = [
+            {
+                'youtube_id': video_data['youtube_id'],
+                'title': video_data['title'],
+                'description': video_data.get('description'),
+                'thumbnail_url': video_data.get('thumbnail_url'),
+                'video_url': video_data['video_url'],
+                'duration': video_data.get('duration'),
+                'playlist_id': playlist_id,
+                'is_downloaded': False,
+                'is_converted': False,
+            }
+            for video_data in videos
+        ]
+        return ingest_service.upsert(db, Audiobook, rows)
+
+    def _fingerprint(self, snapshot: Dict) -> str:
+        """Хэш метаданных и первых видео плейлиста: не изменился — можно не синхронизировать"""
+        payload = json.dumps([
+            snapshot.get('playlist_count'),
+            snapshot.get('modified_date'),
+            [video['youtube_id'] for video in snapshot['videos']],
+        ])
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def sync_playlist(self, playlist_id: int, full: bool = False) -> Dict:
+        """
+        Синхронизация видео плейлиста в отдельной сессии.
+
+        Видео читаются генератором по мере пагинации и записываются пачками
+        по SYNC_BATCH_SIZE, каждая пачка — отдельный commit: память не растёт
+        с размером плейлиста, а при ошибке уже записанное сохраняется.
+
+        Incremental режим: сначала читается только первая страница плейлиста.
+        Если fingerprint не изменился — плейлист пропускается. Иначе идём
+        по видео от новых к старым до первого уже известного id. Если новых
+        видео больше страницы или счётчик плейлиста не сходится с synced_count
+        (видео добавлены в конец), обход продолжается до конца плейлиста.
+        """
+        db = SessionLocal()
+        meta: Dict = {}
+        entries = None
+        try:
+            playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+            if not playlist:
+                raise ValueError("Playlist not found")
+
+            known_ids = set()
+            if playlist.last_seen_ids and not full:
+                known_ids = set(json.loads(playlist.last_seen_ids))
+
+            entries = youtube_service.iter_playlist_videos(playlist.playlist_url, meta)
+            head_videos = list(islice(entries, settings.SYNC_HEAD_SIZE))
+            head = {**meta, 'videos': head_videos}
+            fingerprint = self._fingerprint(head)
+
+            videos = chain(head['videos'], entries)
+            mode = 'full'
+            if known_ids:
+                if fingerprint == playlist.sync_fingerprint:
+                    playlist.last_synced_at = datetime.utcnow()
+                    db.commit()
+                    return {
+                        "playlist_id": playlist_id,
+                        "mode": "skipped",
+                        "found": 0,
+                        "added": 0,
+                        "updated": 0,
+                    }
+
+                new_videos = list(takewhile(
+                    lambda video: video['youtube_id'] not in known_ids, head['videos']
+                ))
+                reached_known = len(new_videos) < len(head['videos'])
+                # Сверяем со счётчиком самого sync, а не с числом аудиокниг плейлиста:
+                # видео из нескольких плейлистов (youtube_id уникален) числится только в одном
+                playlist_count = head.get('playlist_count')
+                if reached_known and (
+                    playlist_count is None or (
+                        playlist.synced_count is not None
+                        and playlist.synced_count + len(new_videos) >= playlist_count
+                    )
+                ):
+                    videos = iter(new_videos)
+                    mode = 'incremental'
+
+            found_count = 0
+            added_count = 0
+            updated_count = 0
+            while True:
+                batch = list(islice(videos, settings.SYNC_BATCH_SIZE))
+                if not batch:
+                    break
+                stats = self.store_playlist_videos(db, playlist_id, batch)
+                db.commit()
+                found_count += len(batch)
+                added_count += stats['inserted']
+                updated_count += stats['updated']
+
+            if mode == 'full':
+                playlist.synced_count = found_count
+            elif head.get('playlist_count') is not None:
+                playlist.synced_count = head['playlist_count']
+            elif playlist.synced_count is not None:
+                playlist.synced_count += found_count
+            playlist.last_seen_ids = json.dumps([video['youtube_id'] for video in head['videos']])
+            playlist.sync_fingerprint = fingerprint
+            playlist.last_synced_at = datetime.utcnow()
+            db.commit()
+
+            return {
+                "playlist_id": playlist_id,
+                "mode": mode,
+                "found": found_count,
+                "added": added_count,
+                "updated": updated_count,
+            }
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if entries is not None:
+                entries.close()
+            db.close()
+
+    async def sync_playlists(
+        self,
+        playlists: List[Dict],
+        concurrency: int | None = None,
+        full: bool = False
+    ) -> List[Dict]:
+        """
+        Параллельная синхронизация видео нескольких плейлистов.
+        playlists: [{'id', 'title', 'playlist_url'}]. Ошибка одного плейлиста
+        не прерывает остальные и попадает в его результат.
+        """
+        if concurrency is None:
+            concurrency = settings.CHANNEL_SYNC_CONCURRENCY
+        # Хотя бы один поток extraction_executor остаётся интерактивным запросам
+        # (stream-info, промахи кэша stream URL, добавление канала)
+        limit = max(settings.EXTRACTION_WORKERS - 1, 1)
+        semaphore = asyncio.Semaphore(min(max(concurrency, 1), limit))
+
+        async def sync_one(playlist: Dict) -> Dict:
+            result = {"playlist_id": playlist['id'], "title": playlist['title']}
+            async with semaphore:
+                try:
+                    synced = await extraction_executor.run(self.sync_playlist, playlist['id'], full)
+                    result.update(
+                        mode=synced['mode'],
+                        found=synced['found'],
+                        added=synced['added'],
+                        updated=synced['updated'],
+                    )
+                    print(f"[Sync] {playlist['title']} ({synced['mode']}): "
+                          f"найдено {synced['found']}, добавлено {synced['added']}")
+                except Exception as e:
+                    detail = getattr(e, 'detail', None) or str(e)
+                    result.update(error=detail)
+                    print(f"[Sync ERROR] {playlist['title']}: {detail}")
+            return result
+
+        return await asyncio.gather(*(sync_one(playlist) for playlist in playlists))
+
+
+# Singleton instance
+sync_service = SyncService()
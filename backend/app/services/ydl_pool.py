@@ -0,0 +1,89 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+import yt_dlp
+
+_MISSING = object()
+
+
+class YoutubeDLPool:
+    """
+    Пул переиспользуемых экземпляров YoutubeDL по профилям опций.
+    Экстракторы, cookie jar и HTTP сессии создаются один раз на экземпляр,
+    а не на каждый запрос. Экземпляр выдаётся одному потоку за раз.
+    """
+
+    def __init__(self, max_idle: int):
+        self.max_idle = max_idle
+        self._profiles: Dict[str, Dict] = {}
+        self._idle: Dict[str, List[yt_dlp.YoutubeDL]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, profile: str, ydl_opts: Dict):
+        """Регистрация профиля опций (flat, in_playlist, full, download...)"""
+        with self._lock:
+            self._profiles[profile] = ydl_opts
+            self._idle.setdefault(profile, [])
+
+    @contextmanager
+    def checkout(self, profile: str, **overrides) -> Iterator[yt_dlp.YoutubeDL]:
+        """
+        Выдача экземпляра профиля. overrides временно меняют params
+        (playlistend, outtmpl, progress_hooks...) и откатываются при возврате.
+        """
+        ydl = self._acquire(profile)
+        hooks = overrides.pop('progress_hooks', None) or []
+        if 'outtmpl' in overrides and isinstance(overrides['outtmpl'], str):
+            overrides['outtmpl'] = {'default': overrides['outtmpl']}
+
+        saved_params = {key: ydl.params.get(key, _MISSING) for key in overrides}
+        saved_hooks = list(ydl._progress_hooks)
+        ydl.params.update(overrides)
+        for hook in hooks:
+            ydl.add_progress_hook(hook)
+        try:
+            yield ydl
+        finally:
+            for key, value in saved_params.items():
+                if value is _MISSING:
+                    ydl.params.pop(key, None)
+                else:
+                    ydl.params[key] = value
+            ydl._progress_hooks[:] = saved_hooks
+            self._release(profile, ydl)
+
+    def warm(self):
+        """Создание по одному экземпляру на профиль и загрузка экстракторов/cookies"""
+        for profile in list(self._profiles):
+            try:
+                with self.checkout(profile) as ydl:
+                    ydl.get_info_extractor('Youtube')
+                    ydl.get_info_extractor('YoutubeTab')
+                    ydl.cookiejar
+            except Exception as e:
+                print(f"[YoutubeDL Pool] Ошибка прогрева профиля {profile}: {e}")
+
+    def close(self):
+        with self._lock:
+            instances = [ydl for idle in self._idle.values() for ydl in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        for ydl in instances:
+            ydl.close()
+
+    def _acquire(self, profile: str) -> yt_dlp.YoutubeDL:
+        with self._lock:
+            idle = self._idle[profile]
+            if idle:
+                return idle.pop()
+            ydl_opts = self._profiles[profile]
+        return yt_dlp.YoutubeDL(dict(ydl_opts))
+
+    def _release(self, profile: str, ydl: yt_dlp.YoutubeDL):
+        with self._lock:
+            idle = self._idle[profile]
+            if len(idle) < self.max_idle:
+                idle.append(ydl)
+                return
+        ydl.close()
@@ -1,7 +1,40 @@
-import yt_dlp
 import os
-from typing import Dict, List, Optional
+import copy
+from typing import Dict, Iterator, List, Optional
 from app.core.config import settings
+from app.services.bandwidth import bandwidth_budget
+from app.services.single_flight import SingleFlight
+from app.services.ydl_pool import YoutubeDLPool
+
+# Профили хранения аудио: формат yt-dlp для скачивания и кодек для стадии
+# конвертации (media_service.extract_audio). quality None - только copy: если yt-dlp
+# выбрал запасной bestaudio с другим кодеком, файл остаётся в исходном контейнере.
+AUDIO_PROFILES = {
+    # Перекодирование в AUDIO_FORMAT / AUDIO_QUALITY (по умолчанию mp3 192 kbps)
+    'transcode': {
+        'format': 'bestaudio/best',
+        'codec': settings.AUDIO_FORMAT,
+        'quality': settings.AUDIO_QUALITY,
+    },
+    # Remux без перекодирования: AAC -> m4a (ffmpeg -c:a copy)
+    'remux-m4a': {
+        'format': 'bestaudio[ext=m4a]/bestaudio',
+        'codec': 'm4a',
+        'quality': None,
+    },
+    # Opus -> .opus (ogg контейнер), тоже copy
+    'remux-ogg': {
+        'format': 'bestaudio[acodec=opus]/bestaudio',
+        'codec': 'opus',
+        'quality': None,
+    },
+    # Нативный webm/opus поток как есть
+    'remux-webm': {
+        'format': 'bestaudio[ext=webm]/bestaudio',
+        'codec': None,
+        'quality': None,
+    },
+}
 
 
 class YouTubeService:
@@ -17,19 +50,45 @@ class YouTubeService:
         
         if settings.YOUTUBE_COOKIE_FILE and os.path.exists(settings.YOUTUBE_COOKIE_FILE):
             self.ydl_opts['cookiefile'] = settings.YOUTUBE_COOKIE_FILE
+        
+        # Одновременные запросы одного видео разделяют одну extract_info
+        self._extractions = SingleFlight()
+        
+        # Переиспользуемые экземпляры YoutubeDL по профилям опций
+        self.ydl_pool = YoutubeDLPool(max_idle=settings.YDL_POOL_MAX_IDLE)
+        self.ydl_pool.register('flat', self.ydl_opts)
+        self.ydl_pool.register('in_playlist', {
+            **self.ydl_opts,
+            'extract_flat': 'in_playlist',
+        })
+        self.ydl_pool.register('full', {
+            **self.ydl_opts,
+            'format': 'bestaudio/best',
+            'extract_flat': False,  # Нужна полная информация
+            'ignoreerrors': False,
+        })
+        # Только скачивание исходного потока: конвертация - отдельная стадия
+        for profile, profile_opts in AUDIO_PROFILES.items():
+            self.ydl_pool.register(f'fetch:{profile}', {
+                **self.ydl_opts,
+                'format': profile_opts['format'],
+                'postprocessors': [],
+                # Детерминированное имя файла: прерванный .part докачивается при повторе
+                'continuedl': True,
+                'nopart': False,
+                'extract_flat': False,
+                'ignoreerrors': False,
+                'quiet': False,
+                'no_warnings': False,
+            })
 
     def get_channel_info(self, channel_url: str) -> Dict:
         """Получение информации о канале"""
         print(f"[YouTube Service] Получение информации о канале: {channel_url}")
         
-        ydl_opts = {
-            **self.ydl_opts,
-            'extract_flat': 'in_playlist',
-            'playlistend': 1,  # Берем только первое видео для быстрой проверки
-        }
-        
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # Берем только первое видео для быстрой проверки
+            with self.ydl_pool.checkout('in_playlist', playlistend=1) as ydl:
                 info = ydl.extract_info(channel_url, download=False)
                 
                 channel_id = info.get('channel_id') or info.get('uploader_id') or info.get('id')
@@ -60,16 +119,11 @@ class YouTubeService:
         else:
             playlists_url = channel_url
         
-        ydl_opts = {
-            **self.ydl_opts,
-            'extract_flat': 'in_playlist',
-            'playlistend': 50,  # Ограничиваем количество плейлистов
-        }
-        
         playlists = []
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # Ограничиваем количество плейлистов
+            with self.ydl_pool.checkout('in_playlist', playlistend=50) as ydl:
                 print(f"[YouTube Service] Извлечение информации о плейлистах...")
                 info = ydl.extract_info(playlists_url, download=False)
                 
@@ -101,59 +155,110 @@ class YouTubeService:
 
     def get_playlist_videos(self, playlist_url: str) -> List[Dict]:
         """Получение всех видео из плейлиста"""
-        ydl_opts = {
-            **self.ydl_opts,
-            'extract_flat': 'in_playlist',
-        }
-        
-        videos = []
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(playlist_url, download=False)
+        return list(self.iter_playlist_videos(playlist_url))
+
+    def iter_playlist_videos(self, playlist_url: str, meta: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Генератор видео плейлиста по мере пагинации yt-dlp.
+        Список entries не материализуется: следующая страница запрашивается,
+        только когда потребитель дошёл до неё. В meta (если передан) до первого
+        видео записываются playlist_count и modified_date.
+        """
+        with self.ydl_pool.checkout('in_playlist') as ydl:
+            # process=False: entries остаются ленивым генератором экстрактора
+            info = ydl.extract_info(playlist_url, download=False, process=False)
+            if info.get('_type') in ('url', 'url_transparent'):
+                info = ydl.extract_info(info['url'], download=False, process=False)
             
-            if 'entries' in info:
-                for entry in info['entries']:
-                    if entry:
-                        video_data = {
-                            'youtube_id': entry.get('id'),
-                            'title': entry.get('title'),
-                            'description': entry.get('description', ''),
-                            'thumbnail_url': self._get_best_thumbnail(entry.get('thumbnails', [])),
-                            'video_url': entry.get('url') or f"https://www.youtube.com/watch?v={entry.get('id')}",
-                            'duration': entry.get('duration'),
-                            'upload_date': entry.get('upload_date'),
-                        }
-                        videos.append(video_data)
-        
-        return videos
+            if meta is not None:
+                meta['playlist_count'] = info.get('playlist_count')
+                meta['modified_date'] = info.get('modified_date')
+            
+            for entry in info.get('entries') or []:
+                if entry and entry.get('id'):
+                    yield {
+                        'youtube_id': entry.get('id'),
+                        'title': entry.get('title'),
+                        'description': entry.get('description', ''),
+                        'thumbnail_url': self._get_best_thumbnail(entry.get('thumbnails', [])),
+                        'video_url': entry.get('url') or f"https://www.youtube.com/watch?v={entry.get('id')}",
+                        'duration': entry.get('duration'),
+                        'upload_date': entry.get('upload_date'),
+                    }
 
-    def download_audio(self, video_url: str, output_path: str, progress_callback=None) -> Dict:
-        """Скачивание аудио из видео"""
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': settings.AUDIO_FORMAT,
-                'preferredquality': settings.AUDIO_QUALITY,
-            }],
-            'outtmpl': output_path,
-            'quiet': False,
-            'no_warnings': False,
+    def extract_video_info(self, video_url: str) -> Dict:
+        """
+        Полная информация о видео (с форматами).
+        Одновременные вызовы для одного video_url выполняют одну extract_info,
+        результат общий — не изменяйте его, делайте копию.
+        """
+        return self._extractions.do(video_url, lambda: self._extract_video_info(video_url))
+
+    def _extract_video_info(self, video_url: str) -> Dict:
+        with self.ydl_pool.checkout('full') as ydl:
+            return ydl.extract_info(video_url, download=False)
+
+    def get_stream_url(self, video_url: str) -> Dict:
+        """Получение прямого URL на аудио stream без скачивания"""
+        info = self.extract_video_info(video_url)
+
+        # Получаем прямой URL на аудио stream
+        if 'url' in info:
+            selected = info
+        elif 'formats' in info:
+            # Находим лучший аудио формат
+            audio_formats = [f for f in info['formats'] if f.get('acodec') != 'none']
+            if not audio_formats:
+                raise ValueError("No audio stream found")
+            # Берём формат с лучшим битрейтом
+            selected = max(audio_formats, key=lambda f: f.get('abr', 0) or 0)
+        else:
+            raise ValueError("Stream URL not available")
+
+        return {
+            'url': selected['url'],
+            'http_headers': selected.get('http_headers') or info.get('http_headers') or {},
+            'ext': selected.get('ext'),
+            'duration': info.get('duration'),
         }
+
+    def fetch_audio(
+        self,
+        video_url: str,
+        output_path: str,
+        progress_callback=None,
+        profile: Optional[str] = None
+    ) -> Dict:
+        """
+        Скачивание исходного аудиопотока без постобработки (I/O стадия).
+        Конвертация выполняется отдельно через media_service.extract_audio.
+        profile - ключ AUDIO_PROFILES (по умолчанию AUDIO_STORAGE_PROFILE).
+        """
+        profile = profile or settings.AUDIO_STORAGE_PROFILE
+        if profile not in AUDIO_PROFILES:
+            raise ValueError(f"Unknown audio profile: {profile}")
         
+        # ratelimit выставляет bandwidth_budget, при возврате в пул он откатывается
+        overrides = {'outtmpl': f"{output_path}.%(ext)s", 'ratelimit': None}
         if progress_callback:
-            ydl_opts['progress_hooks'] = [progress_callback]
+            overrides['progress_hooks'] = [progress_callback]
         
-        if settings.YOUTUBE_COOKIE_FILE and os.path.exists(settings.YOUTUBE_COOKIE_FILE):
-            ydl_opts['cookiefile'] = settings.YOUTUBE_COOKIE_FILE
+        # Метаданные берём из общей extraction, чтобы не дублировать запрос к YouTube
+        shared_info = self.extract_video_info(video_url)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=True)
+        with self.ydl_pool.checkout(f'fetch:{profile}', **overrides) as ydl, bandwidth_budget.share(ydl.params):
+            info = ydl.process_ie_result(copy.deepcopy(shared_info), download=True)
+            
+            # Расширение зависит от выбранного формата (webm / m4a)
+            downloads = info.get('requested_downloads') or [{}]
+            file_path = downloads[0].get('filepath') or ydl.prepare_filename(info)
             
             return {
                 'title': info.get('title'),
                 'duration': info.get('duration'),
-                'file_path': f"{output_path}.{settings.AUDIO_FORMAT}",
+                'file_path': file_path,
+                'filesize': downloads[0].get('filesize') or info.get('filesize'),
+                'format': os.path.splitext(file_path)[1].lstrip('.'),
             }
 
     def _get_best_thumbnail(self, thumbnails: List[Dict]) -> Optional[str]:
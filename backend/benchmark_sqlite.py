@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк SQLite: задержка чтения под нагрузкой записи.
+Сравнивает профиль по умолчанию (rollback journal, без сериализации записи)
+и production профиль (WAL, pragmas, пул, SQLiteWriteLock) на временной БД.
+
+Запуск: python benchmark_sqlite.py [--seconds 10] [--readers 8] [--writers 4]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, create_db_engine
+from app.models import Channel, Playlist, Audiobook
+
+
+def seed(Session, audiobooks: int):
+    db = Session()
+    channel = Channel(youtube_id="bench", title="Bench", channel_url="https://youtube.com/@bench")
+    db.add(channel)
+    db.flush()
+    playlist = Playlist(
+        youtube_id="bench", title="Bench", channel_id=channel.id,
+        playlist_url="https://youtube.com/playlist?list=bench"
+    )
+    db.add(playlist)
+    db.flush()
+    db.add_all([
+        Audiobook(
+            youtube_id=f"bench{i:06d}", title=f"Audiobook {i}", playlist_id=playlist.id,
+            video_url=f"https://youtu.be/bench{i:06d}", description="x" * 500
+        )
+        for i in range(audiobooks)
+    ])
+    db.commit()
+    db.close()
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def run(profile: str, seconds: float, readers: int, writers: int, audiobooks: int) -> dict:
+    directory = tempfile.mkdtemp(prefix="bench_sqlite_")
+    url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    engine = create_db_engine(url, production_profile=(profile == "production"))
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    seed(Session, audiobooks)
+
+    stop = threading.Event()
+    read_latencies = []
+    counters = {"writes": 0, "write_errors": 0, "read_errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        latencies = []
+        while not stop.is_set():
+            db = Session()
+            started = time.perf_counter()
+            try:
+                offset = random.randint(0, max(audiobooks - 100, 0))
+                db.execute(
+                    select(Audiobook).order_by(Audiobook.id).offset(offset).limit(100)
+                ).scalars().all()
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                with lock:
+                    counters["read_errors"] += 1
+            finally:
+                db.close()
+        with lock:
+            read_latencies.extend(latencies)
+
+    def writer():
+        # Как progress_tracker / очередь загрузок: короткие транзакции UPDATE
+        while not stop.is_set():
+            db = Session()
+            try:
+                db.execute(
+                    update(Audiobook)
+                    .where(Audiobook.id == random.randint(1, audiobooks))
+                    .values(download_progress=random.random() * 100)
+                )
+                db.commit()
+                with lock:
+                    counters["writes"] += 1
+            except Exception:
+                db.rollback()
+                with lock:
+                    counters["write_errors"] += 1
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {
+        "profile": profile,
+        "reads": len(read_latencies),
+        "read_p50_ms": percentile(read_latencies, 0.50),
+        "read_p95_ms": percentile(read_latencies, 0.95),
+        "read_p99_ms": percentile(read_latencies, 0.99),
+        "read_max_ms": max(read_latencies, default=0.0),
+        "read_mean_ms": statistics.fmean(read_latencies) if read_latencies else 0.0,
+        **counters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--audiobooks", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"📊 {args.readers} читателей, {args.writers} писателей, {args.seconds} с, {args.audiobooks} аудиокниг\n")
+    header = f"{'profile':<12}{'reads':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>10}{'writes':>9}{'w_err':>7}{'r_err':>7}"
+    print(header)
+    print("-" * len(header))
+    for profile in ("default", "production"):
+        result = run(profile, args.seconds, args.readers, args.writers, args.audiobooks)
+        print(
+            f"{result['profile']:<12}{result['reads']:>8}"
+            f"{result['read_p50_ms']:>8.1f}ms{result['read_p95_ms']:>7.1f}ms{result['read_p99_ms']:>7.1f}ms"
+            f"{result['read_max_ms']:>8.1f}ms{result['writes']:>9}{result['write_errors']:>7}{result['read_errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -84,9 +84,11 @@ export interface Note {
   timestamp?: number
   audiobook_id: number
   ai_discussion?: string
+  discussion_count?: number
 }
 
 export interface ChatMessage {
+  id?: number
   role: string
   content: string
 }
@@ -186,7 +188,7 @@ export const aiApi = {
     }>('/api/ai/discuss', data),
 
   getDiscussionHistory: (noteId: number) =>
-    api.get<{ history: ChatMessage[] }>(`/api/ai/discussion/${noteId}`),
+    api.get<{ history: ChatMessage[]; has_more: boolean; before?: number }>(`/api/ai/discussion/${noteId}`),
 }
 
 export default api
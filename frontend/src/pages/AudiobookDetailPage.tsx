@@ -242,7 +242,7 @@ export default function AudiobookDetailPage() {
     setChatNote(note)
     setChatMessage('') // Очищаем поле ввода при переключении заметки
 
-    if (note.ai_discussion) {
+    if (note.discussion_count || note.ai_discussion) {
       try {
         const response = await aiApi.getDiscussionHistory(note.id)
         if (response.data.history && Array.isArray(response.data.history)) {